@@ -1,15 +1,40 @@
+import threading
 from flask import Flask
 from flask_login import LoginManager
 from .models import db, User
+from .services.structured_db import structured_db
+from .services.weather_ingest import weather_ingest
+from .services.jobs import job_manager
+from .services.fish_recognition import fish_recognizer
+from .services.qa_context import qa_context
+from .services.partitions import partition_manager
+from .services.archive import parquet_archive
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'your_secret_key'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ocean.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    if config:
+        app.config.update(config)  # 覆盖默认配置，例如脚本中使用临时数据库
 
     db.init_app(app)
+    structured_db.init_app(app)
+    weather_ingest.init_app(app)
+    job_manager.init_app(app)
+    fish_recognizer.init_app(app)
+    qa_context.init_app(app)
+    partition_manager.init_app(app)
+    parquet_archive.init_app(app)
+
+    # 原始数据接口的存储后端：structured 为结构化库，typed 为迁移后的主库 WaterQuality 表
+    app.config.setdefault('WATER_DATA_BACKEND', 'structured')
+
+    # 服务进程可开启预热，在后台提前导入数据分析依赖，首个分析请求不再等待导入
+    if app.config.setdefault('ANALYSIS_WARMUP', False):
+        from .services.data_analysis import warm_up
+        threading.Thread(target=warm_up, name='analysis-warmup', daemon=True).start()
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
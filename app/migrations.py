@@ -0,0 +1,114 @@
+from sqlalchemy import MetaData, func, inspect, select, text
+from sqlalchemy.schema import CreateTable
+from .models import WaterQuality, db
+from .services.ingestion import rebuild_derived
+from .services.partitions import list_partitions
+
+# data_version 中记录派生数据回填状态的行；派生表的计算方式变化时递增 DERIVED_REVISION 即可触发重建
+DERIVED_MARKER = 'derived_backfill'
+DERIVED_REVISION = 1
+
+
+def upgrade_columns(engine):
+    """为已存在的表补加模型中新增的可空列
+
+    db.create_all() 不会修改已有的表，旧的 ocean.db 通过 ALTER TABLE ADD COLUMN 补齐；
+    只处理可空且没有服务端默认值的列，已有行的新列为 NULL。返回新增的 "表.列" 列表。
+    """
+    added = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable or column.server_default is not None:
+                    continue
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def upgrade_indexes(engine):
+    """为已存在的表补建模型中声明的索引
+
+    db.create_all() 只在建表时创建索引，旧的 ocean.db 需要通过这里补齐。
+    返回新建的索引名列表。
+    """
+    created = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    created.append(index.name)
+        if created:
+            # 更新统计信息，让查询规划器能正确选择新索引
+            conn.exec_driver_sql("ANALYZE")
+    return created
+
+
+def upgrade_autoincrement(engine):
+    """把旧库中没有 AUTOINCREMENT 的 water_quality 重建为 AUTOINCREMENT 表
+
+    SQLite 不能给已有表加 AUTOINCREMENT，只能新建表、复制数据后替换；
+    sqlite_sequence 设为热表和各分区中的最大 id，之后分配的 id 不会与已搬走或已删除的读数重复。
+    返回是否执行了重建。
+    """
+    source = WaterQuality.__table__
+    with engine.begin() as conn:
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                           {'name': source.name}).scalar()
+        if ddl is None or 'AUTOINCREMENT' in ddl.upper():
+            return False
+        rebuilt = source.to_metadata(MetaData(), name=source.name + '_rebuild')
+        conn.execute(CreateTable(rebuilt))
+        columns = [c.name for c in source.columns]
+        conn.execute(rebuilt.insert().from_select(columns, select(*[source.c[c] for c in columns])))
+        source.drop(conn)
+        conn.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {source.name}"))
+        for index in source.indexes:
+            index.create(conn)
+
+        high_water = max([conn.execute(select(func.max(table.c.id))).scalar() or 0
+                          for table in [source] + [partition for _, partition in list_partitions(conn)]])
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {'name': source.name})
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                     {'name': source.name, 'seq': high_water})
+    return True
+
+
+def backfill_derived(engine):
+    """派生数据（汇总、统计量、断面最新状态、筛选项字典）尚未按当前版本回填时，根据全部原始读数重建
+
+    是否完成由 data_version 中的 DERIVED_MARKER 行持久记录，而不是看派生表是否为空：
+    回填前已经有上传写入了部分派生数据时同样会重建。返回是否执行了重建。
+    """
+    with engine.begin() as conn:
+        # 先写一行占住写锁，多个进程同时启动时只有一个执行重建，其余等待后看到已完成的标记
+        conn.execute(text("INSERT INTO data_version (name, version) VALUES (:name, 0) "
+                          "ON CONFLICT (name) DO NOTHING"), {'name': DERIVED_MARKER})
+        revision = conn.execute(text("SELECT version FROM data_version WHERE name = :name"),
+                                {'name': DERIVED_MARKER}).scalar()
+        if revision >= DERIVED_REVISION:
+            return False
+        rebuild_derived(conn)
+        conn.execute(text("UPDATE data_version SET version = :revision WHERE name = :name"),
+                     {'name': DERIVED_MARKER, 'revision': DERIVED_REVISION})
+    return True
+
+
+def upgrade_database(engine):
+    """db.create_all() 之后的启动迁移：补加新增列、water_quality 改为 AUTOINCREMENT、补建索引并回填派生数据"""
+    upgrade_columns(engine)
+    upgrade_autoincrement(engine)
+    upgrade_indexes(engine)
+    backfill_derived(engine)
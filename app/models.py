@@ -45,10 +45,20 @@ class WeatherData(db.Model):
     cloud_cover = db.Column(db.Float, nullable=True)  # 云量，百分比
     visibility = db.Column(db.Float, nullable=True)  # 能见度，单位：km
     weather_code = db.Column(db.Integer, nullable=True)  # WMO天气代码
+    uv_index = db.Column(db.Float, nullable=True)  # 紫外线指数
+    
+    __table_args__ = (
+        db.Index('ix_weather_data_location_time', 'location_id', 'timestamp'),
+    )
     
     def __repr__(self):
         return f'<WeatherData {self.timestamp}>'
 
+# 水质读数中的数值参数列，汇总、统计、最新状态和分析接口共用
+NUMERIC_COLUMNS = ['temperature', 'pH', 'dissolved_oxygen', 'conductivity',
+                   'turbidity', 'permanganate_index', 'ammonia_nitrogen',
+                   'total_phosphorus', 'total_nitrogen', 'chlorophyll_a', 'algae_density']
+
 class WaterQuality(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     province = db.Column(db.String(100))
@@ -70,5 +80,119 @@ class WaterQuality(db.Model):
     algae_density = db.Column(db.Float)
     station_status = db.Column(db.String(50))
 
+    # 统计、趋势、导出等查询都是“省份/断面 + 时间范围”的组合条件；
+    # AUTOINCREMENT 保证 id 单调递增，读数搬到分区或被删除后 SQLite 也不会复用它们的 id
+    __table_args__ = (
+        db.Index('ix_water_quality_province_time', 'province', 'monitor_time'),
+        db.Index('ix_water_quality_section_time', 'section_name', 'monitor_time'),
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f'<WaterQuality {self.section_name} @ {self.monitor_time}>'
+
+# 水质数据按日/小时的汇总，每个监测断面的每个参数一行
+class WaterQualityRollup(db.Model):
+    __tablename__ = 'water_quality_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # 'day' 或 'hour'
+    bucket = db.Column(db.String(20), nullable=False)  # '2024-01-01' 或 '2024-01-01 08:00'
+    province = db.Column(db.String(100), nullable=False, default='')
+    section_name = db.Column(db.String(200), nullable=False, default='')
+    parameter = db.Column(db.String(50), nullable=False)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.Float, nullable=False, default=0)
+    value_min = db.Column(db.Float)
+    value_max = db.Column(db.Float)
+    value_sum_sq = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket', 'province', 'section_name', 'parameter',
+                            name='uq_water_quality_rollup_key'),
+        db.Index('ix_water_quality_rollup_lookup', 'granularity', 'parameter', 'bucket'),
+    )
+
+    def __repr__(self):
+        return f'<WaterQualityRollup {self.granularity} {self.bucket} {self.parameter}>'
+
+# 数据版本计数器，每次写入新读数时递增，用于判断分析结果缓存是否失效
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
+
+# 各参数按省份/流域/断面/月份维护的增量统计量（Welford 累加器，可跨任意月份合并）
+class ParameterStatistics(db.Model):
+    __tablename__ = 'parameter_statistics'
+    id = db.Column(db.Integer, primary_key=True)
+    province = db.Column(db.String(100), nullable=False, default='')
+    basin = db.Column(db.String(100), nullable=False, default='')
+    section_name = db.Column(db.String(200), nullable=False, default='')
+    month = db.Column(db.String(7), nullable=False)  # '2024-01'
+    parameter = db.Column(db.String(50), nullable=False)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=False, default=0)
+    m2 = db.Column(db.Float, nullable=False, default=0)  # 离差平方和
+    value_min = db.Column(db.Float)
+    value_max = db.Column(db.Float)
+
+    __table_args__ = (
+        db.UniqueConstraint('province', 'basin', 'section_name', 'month', 'parameter',
+                            name='uq_parameter_statistics_key'),
+        db.Index('ix_parameter_statistics_lookup', 'parameter', 'month'),
+    )
+
+    def __repr__(self):
+        return f'<ParameterStatistics {self.month} {self.parameter} n={self.value_count}>'
+
+# 每个监测断面的最新一条读数，导入时随新数据同步更新
+class StationLatest(db.Model):
+    __tablename__ = 'station_latest'
+    id = db.Column(db.Integer, primary_key=True)
+    province = db.Column(db.String(100), nullable=False, default='')
+    section_name = db.Column(db.String(200), nullable=False, default='')
+    basin = db.Column(db.String(100))
+    reading_id = db.Column(db.Integer, nullable=False)  # 对应 water_quality.id
+    monitor_time = db.Column(db.DateTime, nullable=False)
+    quality_level = db.Column(db.String(10))
+    temperature = db.Column(db.Float)
+    pH = db.Column(db.Float)
+    dissolved_oxygen = db.Column(db.Float)
+    conductivity = db.Column(db.Float)
+    turbidity = db.Column(db.Float)
+    permanganate_index = db.Column(db.Float)
+    ammonia_nitrogen = db.Column(db.Float)
+    total_phosphorus = db.Column(db.Float)
+    total_nitrogen = db.Column(db.Float)
+    chlorophyll_a = db.Column(db.Float)
+    algae_density = db.Column(db.Float)
+    station_status = db.Column(db.String(50))
+
+    __table_args__ = (
+        db.UniqueConstraint('province', 'section_name', name='uq_station_latest_station'),
+        db.Index('ix_station_latest_time', 'monitor_time'),
+    )
+
+    def __repr__(self):
+        return f'<StationLatest {self.province} {self.section_name} {self.monitor_time}>'
+
+# 主库的省份/流域/断面筛选项字典，导入时随新数据同步累加
+class WaterQualityFacet(db.Model):
+    __tablename__ = 'water_quality_facet'
+    id = db.Column(db.Integer, primary_key=True)
+    province = db.Column(db.String(100), nullable=False, default='')
+    basin = db.Column(db.String(100), nullable=False, default='')
+    section_name = db.Column(db.String(200), nullable=False, default='')
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    first_time = db.Column(db.DateTime)
+    last_time = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('province', 'basin', 'section_name', name='uq_water_quality_facet_key'),
+    )
+
     def __repr__(self):
-        return f'<WaterQuality {self.section_name} @ {self.monitor_time}>'
\ No newline at end of file
+        return f'<WaterQualityFacet {self.province} {self.basin} {self.section_name} n={self.row_count}>'
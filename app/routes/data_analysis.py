@@ -1,26 +1,68 @@
-from flask import Blueprint, request, jsonify, send_file, flash, redirect, url_for
+from flask import Blueprint, request, jsonify, send_file, flash, redirect, url_for, Response, stream_with_context
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-import pandas as pd
+from sqlalchemy import select
 import os
 import io
+import csv
+import tempfile
 from datetime import datetime
-from ..models import WaterQuality, db
+from ..models import NUMERIC_COLUMNS, db
 from ..services.data_analysis import DataAnalysisService
+from ..services.partitions import water_quality_source
+from ..services.ingestion import WaterQualityIngestor
+from ..services.result_cache import ResultCache, current_data_version
+from ..services.jobs import job_manager
+from ..services.downsampling import DOWNSAMPLERS
 
 analysis_bp = Blueprint('analysis', __name__)
 data_service = DataAnalysisService()
+ingestor = WaterQualityIngestor()
+result_cache = ResultCache()
 
 # 配置上传
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 
+# 导出的列及每次从数据库读取的行数
+EXPORT_COLUMNS = ['id', 'province', 'basin', 'section_name', 'monitor_time', 'quality_level'] + \
+    NUMERIC_COLUMNS + ['station_status']
+EXPORT_CHUNK_SIZE = 2000
+
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def cache_header(response, hit):
+    """在响应头中标记分析结果是否来自缓存"""
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+def payload(field, empty_message):
+    """把分析结果转换为响应字典的函数，结果为空时返回提示信息"""
+    return lambda value: {'success': True, field: value} if value else {'success': False, 'message': empty_message}
+
+def analysis_response(endpoint, params, compute, render):
+    """执行（或从缓存读取）分析并生成响应
+
+    请求带 async=1 且缓存未命中时，把计算提交为后台任务并立即返回 202 和任务 id，
+    之后通过 /api/data/jobs/<job_id> 查询结果；相同参数的进行中任务会被复用。
+    """
+    if request.args.get('async') == '1':
+        key = result_cache.make_key(endpoint, params, current_data_version())
+        hit, value = result_cache.get(key)
+        if hit:
+            return cache_header(jsonify(render(value)), True)
+        job, _ = job_manager.submit(
+            key, lambda: render(result_cache.get_or_compute(endpoint, params, compute)[0]))
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status,
+                        'status_url': url_for('analysis.get_job', job_id=job.id)}), 202
+    
+    value, hit = result_cache.get_or_compute(endpoint, params, compute)
+    return cache_header(jsonify(render(value)), hit)
+
 @analysis_bp.route('/api/data/statistics')
 @login_required
 def get_statistics():
@@ -35,12 +77,10 @@ def get_statistics():
         if end_date:
             end_date = datetime.fromisoformat(end_date)
         
-        stats = data_service.get_water_quality_statistics(start_date, end_date, province)
-        
-        if stats:
-            return jsonify({'success': True, 'data': stats})
-        else:
-            return jsonify({'success': False, 'message': '没有找到数据'})
+        return analysis_response(
+            'statistics', {'start_date': start_date, 'end_date': end_date, 'province': province},
+            lambda: data_service.get_water_quality_statistics(start_date, end_date, province),
+            payload('data', '没有找到数据'))
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -58,12 +98,10 @@ def get_correlation():
         if end_date:
             end_date = datetime.fromisoformat(end_date)
         
-        correlation_plot = data_service.generate_correlation_analysis(start_date, end_date)
-        
-        if correlation_plot:
-            return jsonify({'success': True, 'plot': correlation_plot})
-        else:
-            return jsonify({'success': False, 'message': '数据不足，无法生成相关性分析'})
+        return analysis_response(
+            'correlation', {'start_date': start_date, 'end_date': end_date},
+            lambda: data_service.generate_correlation_analysis(start_date, end_date),
+            payload('plot', '数据不足，无法生成相关性分析'))
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -76,6 +114,14 @@ def get_trend():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     province = request.args.get('province')
+    # 可选降采样：max_points 为返回的最大点数，downsample 为 lttb 或 minmax
+    max_points = request.args.get('max_points', type=int)
+    method = request.args.get('downsample', 'lttb')
+    
+    if method not in DOWNSAMPLERS:
+        return jsonify({'success': False, 'message': f'不支持的降采样方法: {method}'}), 400
+    if max_points is not None and max_points < 3:
+        return jsonify({'success': False, 'message': 'max_points 不能小于 3'}), 400
     
     try:
         if start_date:
@@ -83,12 +129,12 @@ def get_trend():
         if end_date:
             end_date = datetime.fromisoformat(end_date)
         
-        trend_plot = data_service.generate_trend_analysis(parameter, start_date, end_date, province)
-        
-        if trend_plot:
-            return jsonify({'success': True, 'plot': trend_plot})
-        else:
-            return jsonify({'success': False, 'message': '数据不足，无法生成趋势分析'})
+        return analysis_response(
+            'trend', {'parameter': parameter, 'start_date': start_date, 'end_date': end_date, 'province': province,
+                      'max_points': max_points, 'downsample': method if max_points else None},
+            lambda: data_service.generate_trend_analysis(parameter, start_date, end_date, province,
+                                                         max_points, method),
+            payload('plot', '数据不足，无法生成趋势分析'))
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -100,12 +146,11 @@ def get_clustering():
     n_clusters = int(request.args.get('n_clusters', 3))
     
     try:
-        result = data_service.perform_clustering_analysis(n_clusters)
-        
-        if result:
-            return jsonify({'success': True, 'data': result})
-        else:
-            return jsonify({'success': False, 'message': '数据不足，无法进行聚类分析'})
+        # 聚类使用最近30天的滑动窗口，按小时区分缓存
+        return analysis_response(
+            'clustering', {'n_clusters': n_clusters, 'window_end': datetime.now().strftime('%Y-%m-%d %H')},
+            lambda: data_service.perform_clustering_analysis(n_clusters),
+            payload('data', '数据不足，无法进行聚类分析'))
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -123,16 +168,29 @@ def get_report():
         if end_date:
             end_date = datetime.fromisoformat(end_date)
         
-        report = data_service.generate_quality_report(start_date, end_date)
-        
-        if report:
-            return jsonify({'success': True, 'data': report})
-        else:
-            return jsonify({'success': False, 'message': '没有找到数据'})
+        return analysis_response(
+            'report', {'start_date': start_date, 'end_date': end_date},
+            lambda: data_service.generate_quality_report(start_date, end_date),
+            payload('data', '没有找到数据'))
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@analysis_bp.route('/api/data/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    """查询后台分析任务的状态和结果"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+@analysis_bp.route('/api/data/cache/stats')
+@login_required
+def get_cache_stats():
+    """获取分析结果缓存的命中统计"""
+    return jsonify({'success': True, 'data': result_cache.stats()})
+
 @analysis_bp.route('/api/data/upload', methods=['POST'])
 @login_required
 def upload_data():
@@ -151,14 +209,15 @@ def upload_data():
         
         try:
             # 读取文件
+            import pandas as pd
             if filename.endswith('.csv'):
                 df = pd.read_csv(filepath, encoding='utf-8')
             else:
                 df = pd.read_excel(filepath)
             
             # 数据验证和处理
-            required_columns = ['monitor_time', 'province', 'section_name']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            df = ingestor.map_columns(df)
+            missing_columns = ingestor.missing_columns(df)
             
             if missing_columns:
                 os.remove(filepath)
@@ -167,50 +226,16 @@ def upload_data():
                     'message': f'缺少必要列: {", ".join(missing_columns)}'
                 })
             
-            # 数据导入
-            success_count = 0
-            error_count = 0
-            
-            for _, row in df.iterrows():
-                try:
-                    # 解析时间
-                    monitor_time = pd.to_datetime(row['monitor_time'])
-                    
-                    water_quality = WaterQuality(
-                        province=row.get('province'),
-                        basin=row.get('basin'),
-                        section_name=row.get('section_name'),
-                        monitor_time=monitor_time,
-                        quality_level=row.get('quality_level'),
-                        temperature=row.get('temperature'),
-                        pH=row.get('pH'),
-                        dissolved_oxygen=row.get('dissolved_oxygen'),
-                        conductivity=row.get('conductivity'),
-                        turbidity=row.get('turbidity'),
-                        permanganate_index=row.get('permanganate_index'),
-                        ammonia_nitrogen=row.get('ammonia_nitrogen'),
-                        total_phosphorus=row.get('total_phosphorus'),
-                        total_nitrogen=row.get('total_nitrogen'),
-                        chlorophyll_a=row.get('chlorophyll_a'),
-                        algae_density=row.get('algae_density'),
-                        station_status=row.get('station_status')
-                    )
-                    
-                    db.session.add(water_quality)
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_count += 1
-                    continue
+            # 数据导入：整个文件在一个事务中分块批量写入
+            with db.engine.begin() as conn:
+                result = ingestor.ingest(df, conn)
             
-            db.session.commit()
             os.remove(filepath)  # 删除临时文件
             
             return jsonify({
                 'success': True,
-                'message': f'数据上传成功！成功导入 {success_count} 条记录，失败 {error_count} 条',
-                'success_count': success_count,
-                'error_count': error_count
+                'message': f'数据上传成功！成功导入 {result.success_count} 条记录，失败 {result.error_count} 条',
+                **result.to_dict()
             })
             
         except Exception as e:
@@ -223,78 +248,70 @@ def upload_data():
 @analysis_bp.route('/api/data/export')
 @login_required
 def export_data():
-    """导出数据"""
+    """导出数据
+
+    按块从数据库读取并直接写出，内存占用与导出规模无关：
+    CSV 以分块响应流式返回，Excel 使用只写模式的工作簿写入临时文件。
+    """
     format_type = request.args.get('format', 'csv')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     province = request.args.get('province')
     
     try:
-        # 构建查询
-        query = WaterQuality.query
+        if format_type not in ('csv', 'excel'):
+            return jsonify({'success': False, 'message': '不支持的导出格式'})
         
+        # 构建查询
         if start_date:
             start_date = datetime.fromisoformat(start_date)
-            query = query.filter(WaterQuality.monitor_time >= start_date)
         if end_date:
             end_date = datetime.fromisoformat(end_date)
-            query = query.filter(WaterQuality.monitor_time <= end_date)
-        if province:
-            query = query.filter(WaterQuality.province == province)
-        
-        data = query.all()
+        source = water_quality_source(start_date, end_date)
+        conditions = DataAnalysisService._filter_conditions(start_date, end_date, province, source)
+        columns = [getattr(source, name) for name in EXPORT_COLUMNS]
         
-        if not data:
+        if not db.session.query(source.id).filter(*conditions).first():
             return jsonify({'success': False, 'message': '没有找到数据'})
         
-        # 转换为DataFrame
-        df = pd.DataFrame([{
-            'id': d.id,
-            'province': d.province,
-            'basin': d.basin,
-            'section_name': d.section_name,
-            'monitor_time': d.monitor_time,
-            'quality_level': d.quality_level,
-            'temperature': d.temperature,
-            'pH': d.pH,
-            'dissolved_oxygen': d.dissolved_oxygen,
-            'conductivity': d.conductivity,
-            'turbidity': d.turbidity,
-            'permanganate_index': d.permanganate_index,
-            'ammonia_nitrogen': d.ammonia_nitrogen,
-            'total_phosphorus': d.total_phosphorus,
-            'total_nitrogen': d.total_nitrogen,
-            'chlorophyll_a': d.chlorophyll_a,
-            'algae_density': d.algae_density,
-            'station_status': d.station_status
-        } for d in data])
-        
-        # 生成文件
-        output = io.BytesIO()
+        stmt = select(*columns).where(*conditions).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         if format_type == 'csv':
-            df.to_csv(output, index=False, encoding='utf-8-sig')
-            output.seek(0)
-            return send_file(
-                output,
+            def generate():
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_COLUMNS)
+                yield '\ufeff' + buffer.getvalue()  # 与 utf-8-sig 一致，便于 Excel 识别编码
+                for rows in db.session.execute(stmt).partitions():
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+            
+            return Response(
+                stream_with_context(generate()),
                 mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'water_quality_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+                headers={'Content-Disposition': f'attachment; filename=water_quality_data_{timestamp}.csv'}
             )
         
-        elif format_type == 'excel':
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='水质数据', index=False)
-            output.seek(0)
-            return send_file(
-                output,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'water_quality_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            )
-        
-        else:
-            return jsonify({'success': False, 'message': '不支持的导出格式'})
+        # 只写模式的工作簿逐行落盘，不在内存中保留整张表
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('水质数据')
+        sheet.append(EXPORT_COLUMNS)
+        for rows in db.session.execute(stmt).partitions():
+            for row in rows:
+                sheet.append(list(row))
+        output = tempfile.TemporaryFile()
+        workbook.save(output)
+        output.seek(0)
+        return send_file(
+            output,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=f'water_quality_data_{timestamp}.xlsx'
+        )
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
\ No newline at end of file
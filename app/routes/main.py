@@ -1,8 +1,12 @@
 from flask import render_template, session, redirect, url_for, Blueprint, flash, request, jsonify
 from flask_login import login_required, current_user
-from ..models import User, db, WaterQuality
+from ..models import NUMERIC_COLUMNS, User, db, WaterQuality, StationLatest
+from ..services.rollup import query_rollup_averages
+from ..services.station_latest import latest_readings
+from ..services.partitions import water_quality_source
+from ..services.qa_context import qa_context
+from ..services.fish_recognition import fish_recognizer, FISH_SPECIES, InvalidImageError
 from datetime import datetime, timedelta
-from sqlalchemy import func
 
 main_bp = Blueprint('main', __name__)
 
@@ -114,6 +118,7 @@ def water_quality_history_api():
     """
     # 1. 从请求参数中获取查询条件
     data_type = request.args.get('dataType', 'temperature') # 默认为'temperature'
+    granularity = 'hour' if request.args.get('granularity') == 'hour' else 'day'
     start_date_str = request.args.get('startDate')
     end_date_str = request.args.get('endDate')
 
@@ -137,25 +142,18 @@ def water_quality_history_api():
     }
     selected_column = column_map.get(data_type, WaterQuality.temperature)
 
-    # 4. 从数据库查询数据 (日平均值)
-    query = db.session.query(
-        func.date(WaterQuality.monitor_time).label('date'),
-        func.avg(selected_column).label('avg_value')
-    ).filter(
-        WaterQuality.monitor_time.between(start_date, end_date),
-        selected_column.isnot(None)
-    ).group_by('date').order_by('date')
-    
-    results = query.all()
+    # 4. 从日/小时汇总表查询平均值，耗时只与天数有关，与读数数量无关
+    results = query_rollup_averages([selected_column.key], start_date, end_date, granularity)
 
     # 5. 格式化图表数据
-    labels = [result.date for result in results]
+    labels = [result.bucket for result in results]
     data_points = [round(result.avg_value, 2) if result.avg_value is not None else 0 for result in results]
     
     # 6. 获取表格的详细数据记录
-    table_records_query = WaterQuality.query.filter(
-        WaterQuality.monitor_time.between(start_date, end_date)
-    ).order_by(WaterQuality.monitor_time.desc()).limit(10)
+    source = water_quality_source(start_date, end_date)
+    table_records_query = db.session.query(source).filter(
+        source.monitor_time.between(start_date, end_date)
+    ).order_by(source.monitor_time.desc()).limit(10)
     
     table_data = [
         {
@@ -177,6 +175,26 @@ def water_quality_history_api():
         'tableData': table_data
     })
 
+@main_bp.route('/api/water_quality/latest')
+def latest_water_quality_api():
+    """
+    返回每个监测断面的最新一条读数，可按省份、流域筛选。
+    """
+    readings = latest_readings(request.args.get('province'), request.args.get('basin'))
+    return jsonify({
+        'success': True,
+        'count': len(readings),
+        'data': [{
+            'province': r.province or None,
+            'basin': r.basin,
+            'section_name': r.section_name or None,
+            'monitor_time': r.monitor_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'quality_level': r.quality_level,
+            **{col: getattr(r, col) for col in NUMERIC_COLUMNS},
+            'station_status': r.station_status
+        } for r in readings]
+    })
+
 @main_bp.route('/api/doubao-chat', methods=['POST'])
 @login_required
 def doubao_chat():
@@ -211,6 +229,27 @@ def doubao_chat():
     except Exception as e:
         return jsonify({'error': f'服务异常: {str(e)}'}), 500
 
+# 鱼类识别允许的图片格式及批量接口单次最多图片数
+FISH_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+FISH_BATCH_LIMIT = 32
+
+def allowed_fish_image(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in FISH_IMAGE_EXTENSIONS
+
+def format_fish_result(prediction):
+    """把模型输出转换为接口返回的识别结果"""
+    species = FISH_SPECIES[prediction['species_index']]
+    return {
+        'fish_type': species['name'],
+        'confidence': prediction['confidence'],
+        'predicted_length': prediction['predicted_length'],
+        'health_score': prediction['health_score'],
+        'avg_length': species['avg_length'],
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'recommendations': generate_fish_recommendations(
+            species['name'], prediction['predicted_length'], prediction['health_score'])
+    }
+
 @main_bp.route('/api/fish-recognition', methods=['POST'])
 def fish_recognition():
     """鱼类识别API"""
@@ -230,48 +269,76 @@ def fish_recognition():
             }), 400
         
         # 检查文件类型
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
-        if not ('.' in file.filename and 
-                file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
+        if not allowed_fish_image(file.filename):
             return jsonify({
                 'status': 'error',
                 'message': '不支持的文件格式'
             }), 400
         
-        # 模拟鱼类识别处理
-        # 在实际应用中，这里会调用深度学习模型进行图像识别
-        import random
-        import time
+        # 预处理和推理在识别引擎的工作线程中完成，与其他请求合批执行
+        prediction = fish_recognizer.recognize([file.read()])[0]
+        if isinstance(prediction, InvalidImageError):
+            return jsonify({
+                'status': 'error',
+                'message': str(prediction)
+            }), 400
+        if isinstance(prediction, Exception):
+            raise prediction
         
-        # 模拟处理时间
-        time.sleep(1)
+        return jsonify({
+            'status': 'success',
+            'data': format_fish_result(prediction)
+        })
         
-        # 模拟识别结果
-        fish_types = [
-            {'name': '鲈鱼', 'confidence': 0.92, 'avg_length': '25-35cm'},
-            {'name': '武昌鱼', 'confidence': 0.88, 'avg_length': '20-30cm'},
-            {'name': '狗鱼', 'confidence': 0.85, 'avg_length': '30-45cm'},
-            {'name': '鲤鱼', 'confidence': 0.90, 'avg_length': '25-40cm'},
-            {'name': '草鱼', 'confidence': 0.87, 'avg_length': '35-50cm'}
-        ]
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'识别过程中发生错误: {str(e)}'
+        }), 500
+
+@main_bp.route('/api/fish-recognition/stats')
+@login_required
+def fish_recognition_stats():
+    """识别引擎的批处理统计：平均批大小反映合批效果"""
+    return jsonify({
+        'status': 'success',
+        'data': fish_recognizer.stats()
+    })
+
+@main_bp.route('/api/fish-recognition/batch', methods=['POST'])
+def fish_recognition_batch():
+    """批量鱼类识别API：表单字段 images 可包含多张图片，结果按上传顺序返回"""
+    try:
+        files = [f for f in request.files.getlist('images') if f.filename]
+        if not files:
+            return jsonify({
+                'status': 'error',
+                'message': '未找到图片文件'
+            }), 400
+        if len(files) > FISH_BATCH_LIMIT:
+            return jsonify({
+                'status': 'error',
+                'message': f'单次最多识别 {FISH_BATCH_LIMIT} 张图片'
+            }), 400
         
-        selected_fish = random.choice(fish_types)
-        predicted_length = round(random.uniform(20, 35), 1)
-        health_score = round(random.uniform(80, 100), 1)
+        valid = [f for f in files if allowed_fish_image(f.filename)]
+        predictions = iter(fish_recognizer.recognize([f.read() for f in valid]))
         
-        result = {
-            'fish_type': selected_fish['name'],
-            'confidence': selected_fish['confidence'],
-            'predicted_length': predicted_length,
-            'health_score': health_score,
-            'avg_length': selected_fish['avg_length'],
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'recommendations': generate_fish_recommendations(selected_fish['name'], predicted_length, health_score)
-        }
+        results = []
+        for file in files:
+            item = {'filename': file.filename}
+            prediction = next(predictions) if allowed_fish_image(file.filename) else None
+            if prediction is None:
+                item.update(status='error', message='不支持的文件格式')
+            elif isinstance(prediction, Exception):
+                item.update(status='error', message=str(prediction))
+            else:
+                item.update(status='success', data=format_fish_result(prediction))
+            results.append(item)
         
         return jsonify({
             'status': 'success',
-            'data': result
+            'data': results
         })
         
     except Exception as e:
@@ -311,42 +378,21 @@ def generate_fish_recommendations(fish_type, length, health_score):
 
 def analyze_question_and_get_data(question):
     """
-    分析问题并获取相关数据
+    分析问题并获取相关数据（从定期刷新的上下文快照中读取）
     """
-    context_data = {}
-    
-    # 获取最新水质数据
-    if any(keyword in question for keyword in ['水质', 'pH', '温度', '溶解氧', '浊度', '电导率']):
-        latest_water_data = get_latest_water_quality_data()
-        context_data['water_quality'] = latest_water_data
-        
-        # 获取水质趋势数据
-        trend_data = get_water_quality_trend()
-        context_data['water_trend'] = trend_data
-    
-    # 获取鱼类相关数据（模拟数据）
-    if any(keyword in question for keyword in ['鱼', '鱼类', '养殖', '产量', '生长']):
-        fish_data = get_fish_data_simulation()
-        context_data['fish_data'] = fish_data
-    
-    # 获取设备状态数据（模拟数据）
-    if any(keyword in question for keyword in ['设备', '传感器', '摄像头', '维护']):
-        equipment_data = get_equipment_status_simulation()
-        context_data['equipment'] = equipment_data
-    
-    # 获取环境数据
-    if any(keyword in question for keyword in ['环境', '天气', '气温', '湿度']):
-        environment_data = get_environment_data_simulation()
-        context_data['environment'] = environment_data
-    
-    return context_data
+    return qa_context.get_context(question)
 
+@qa_context.source('water_quality')
 def get_latest_water_quality_data():
     """
     获取最新的水质数据
     """
     try:
-        latest_record = WaterQuality.query.order_by(WaterQuality.monitor_time.desc()).first()
+        # 各断面最新状态表很小，取全局最新一条不必扫描原始读数；表尚未回填时退回原始表
+        source = water_quality_source()
+        latest_record = StationLatest.query.order_by(
+            StationLatest.monitor_time.desc(), StationLatest.reading_id.desc()).first() or \
+            db.session.query(source).order_by(source.monitor_time.desc()).first()
         if latest_record:
             return {
                 'monitor_time': latest_record.monitor_time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -356,12 +402,13 @@ def get_latest_water_quality_data():
                 'turbidity': latest_record.turbidity,
                 'conductivity': latest_record.conductivity,
                 'quality_level': latest_record.quality_level,
-                'section_name': latest_record.section_name
+                'section_name': latest_record.section_name or None
             }
     except Exception as e:
         print(f"获取水质数据错误: {e}")
     return None
 
+@qa_context.source('water_trend')
 def get_water_quality_trend():
     """
     获取水质趋势数据（最近7天）
@@ -370,25 +417,23 @@ def get_water_quality_trend():
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=7)
         
-        trend_data = db.session.query(
-            func.date(WaterQuality.monitor_time).label('date'),
-            func.avg(WaterQuality.temperature).label('avg_temp'),
-            func.avg(WaterQuality.pH).label('avg_ph'),
-            func.avg(WaterQuality.dissolved_oxygen).label('avg_oxygen')
-        ).filter(
-            WaterQuality.monitor_time.between(start_date, end_date)
-        ).group_by('date').order_by('date').all()
+        rows = query_rollup_averages(['temperature', 'pH', 'dissolved_oxygen'], start_date, end_date)
+        
+        trend_data = {}
+        for bucket, parameter, avg_value in rows:
+            trend_data.setdefault(bucket, {})[parameter] = avg_value
         
         return [{
-            'date': str(record.date),
-            'temperature': round(record.avg_temp, 2) if record.avg_temp else None,
-            'pH': round(record.avg_ph, 2) if record.avg_ph else None,
-            'dissolved_oxygen': round(record.avg_oxygen, 2) if record.avg_oxygen else None
-        } for record in trend_data]
+            'date': date,
+            'temperature': round(values['temperature'], 2) if values.get('temperature') else None,
+            'pH': round(values['pH'], 2) if values.get('pH') else None,
+            'dissolved_oxygen': round(values['dissolved_oxygen'], 2) if values.get('dissolved_oxygen') else None
+        } for date, values in trend_data.items()]
     except Exception as e:
         print(f"获取水质趋势数据错误: {e}")
     return []
 
+@qa_context.source('fish_data')
 def get_fish_data_simulation():
     """
     模拟鱼类数据
@@ -405,6 +450,7 @@ def get_fish_data_simulation():
         'estimated_harvest_date': '2024-08-15'
     }
 
+@qa_context.source('equipment')
 def get_equipment_status_simulation():
     """
     模拟设备状态数据
@@ -421,6 +467,7 @@ def get_equipment_status_simulation():
         ]
     }
 
+@qa_context.source('environment')
 def get_environment_data_simulation():
     """
     模拟环境数据
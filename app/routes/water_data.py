@@ -1,17 +1,48 @@
 from flask import Blueprint, jsonify, request
-import sqlite3
-import os
+import json
+import base64
+
+from ..services.raw_data import raw_data_backend
+from ..services.result_cache import ResultCache
 
 data_bp = Blueprint('data', __name__)
 
-DB_PATH = os.path.join('instance', 'water_quality_structured.db')
+# 筛选条件对应的总行数缓存：键包含后端的数据版本，数据变化后旧条目不再命中，按 LRU 淘汰
+count_cache = ResultCache(max_entries=1024)
+
+def encode_cursor(last_id):
+    """将最后一条记录的 id 编码为不透明的游标字符串"""
+    raw = json.dumps({'id': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解析游标，空游标表示从头开始；格式错误时抛出 ValueError"""
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return int(json.loads(raw)['id'])
+    except Exception:
+        raise ValueError('无效的游标')
+
+def get_cached_total(backend, province, basin):
+    """返回筛选条件下的总行数，后端数据版本不变时复用"""
+    params = {'backend': backend.name, 'province': province, 'basin': basin}
+    key = count_cache.make_key('water_quality_data_total', params, backend.data_version())
+    hit, total = count_cache.get(key)
+    if not hit:
+        total = backend.count(province, basin)
+        count_cache.set(key, total)
+    return total
 
 @data_bp.route('/api/water_quality_data')
 def get_water_quality_data():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    """分页查询原始水质数据
 
+    传入 cursor 参数（首页为空字符串）时使用基于 id 的游标分页，每页开销与翻页深度无关，
+    总数仅在 include_total=1 时返回；否则沿用 page/page_size 的偏移分页。
+    数据来自 WATER_DATA_BACKEND 配置的存储后端，两种后端返回的字段一致。
+    """
     # 获取筛选参数
     province = request.args.get('province')
     basin = request.args.get('basin')
@@ -19,35 +50,32 @@ def get_water_quality_data():
     page_size = int(request.args.get('page_size', 100))
     offset = (page - 1) * page_size
 
-    # 构建查询
-    base_query = "SELECT * FROM water_quality"
-    filters = []
-    params = []
-
-    if province:
-        filters.append("省份 = ?")
-        params.append(province)
-    if basin:
-        filters.append("流域 = ?")
-        params.append(basin)
-    if filters:
-        base_query += " WHERE " + " AND ".join(filters)
+    try:
+        backend = raw_data_backend()
+        if 'cursor' in request.args:
+            try:
+                last_id = decode_cursor(request.args.get('cursor'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
-    # 查询总数
-    count_query = base_query.replace("SELECT *", "SELECT COUNT(*) as total")
-    cursor.execute(count_query, params)
-    total = cursor.fetchone()["total"]
+            # 多取一条用于判断是否还有下一页
+            rows = backend.fetch_after(last_id, page_size + 1, province, basin)
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
 
-    # 查询数据
-    base_query += " LIMIT ? OFFSET ?"
-    params.extend([page_size, offset])
+            response = {
+                "data": rows,
+                "page_size": page_size,
+                "next_cursor": encode_cursor(rows[-1]["id"]) if has_more else None
+            }
+            if request.args.get('include_total') in ('1', 'true'):
+                response["total"] = get_cached_total(backend, province, basin)
+            return jsonify(response)
 
-    try:
-        cursor.execute(base_query, params)
-        rows = cursor.fetchall()
-        result = [dict(row) for row in rows]
+        # 兼容旧客户端的偏移分页，总数走缓存
+        total = get_cached_total(backend, province, basin)
         response = {
-            "data": result,
+            "data": backend.fetch_page(offset, page_size, province, basin),
             "total": total,
             "page": page,
             "page_size": page_size
@@ -55,27 +83,26 @@ def get_water_quality_data():
         return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
         
+def conditional_json(data):
+    """返回带 ETag 的 JSON 响应，客户端缓存未变化时返回 304"""
+    response = jsonify(data)
+    response.add_etag()
+    return response.make_conditional(request)
+
 @data_bp.route('/api/provinces')
 def get_provinces():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT 省份 FROM water_quality")
-    provinces = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(provinces)
+    return conditional_json(raw_data_backend().provinces())
 
 @data_bp.route('/api/basins')
 def get_basins():
     province = request.args.get('province')
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    if province:
-        cursor.execute("SELECT DISTINCT 流域 FROM water_quality WHERE 省份 = ?", (province,))
-    else:
-        cursor.execute("SELECT DISTINCT 流域 FROM water_quality")
-    basins = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(basins)
\ No newline at end of file
+    return conditional_json(raw_data_backend().basins(province))
+
+@data_bp.route('/api/facets')
+def get_facets():
+    """省份 -> 流域 -> 断面的完整筛选项字典，含各级行数和时间范围"""
+    tree = raw_data_backend().facet_tree()
+    if tree is None:
+        return jsonify({"error": "筛选项字典尚未生成，请运行 python import_waterdata.py --refresh-facets"}), 404
+    return conditional_json(tree)
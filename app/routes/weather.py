@@ -1,9 +1,85 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, current_app
 from flask_login import login_required
+from datetime import datetime, timedelta
+from ..models import RanchLocation, WeatherData, db
 from ..services.weather_service import WeatherService
+from ..services.weather_ingest import latest_weather_by_location
 
 weather_bp = Blueprint('weather', __name__)
 
+def format_current_weather(weather_data):
+    """提取 open-meteo 当前天气数据中前端需要的字段"""
+    current = weather_data.get("current", {})
+    weather_code = current.get("weather_code")
+    
+    return {
+        'temperature': current.get("temperature_2m"),
+        'humidity': current.get("relative_humidity_2m"),
+        'precipitation': current.get("precipitation"),
+        'wind_speed': current.get("wind_speed_10m"),
+        'wind_direction': current.get("wind_direction_10m"),
+        'pressure': current.get("pressure_msl"),
+        'surface_pressure': current.get("surface_pressure"),
+        'cloud_cover': current.get("cloud_cover"),
+        'uv_index': current.get("uv_index"),
+        'visibility': current.get("visibility"),
+        'is_day': current.get("is_day"),
+        'weather_code': weather_code,
+        'weather_description': WeatherService.get_weather_code_description(weather_code)
+    }
+
+def format_stored_weather(record):
+    """将本地 WeatherData 记录转换为与实时接口相同的字段"""
+    return {
+        'temperature': record.temperature,
+        'humidity': record.humidity,
+        'precipitation': record.precipitation,
+        'wind_speed': record.wind_speed,
+        'wind_direction': record.wind_direction,
+        'pressure': record.pressure,
+        'surface_pressure': None,
+        'cloud_cover': record.cloud_cover,
+        'uv_index': record.uv_index,
+        'visibility': record.visibility * 1000 if record.visibility is not None else None,
+        'is_day': None,
+        'weather_code': record.weather_code,
+        'weather_description': WeatherService.get_weather_code_description(record.weather_code),
+        'timestamp': record.timestamp.isoformat()
+    }
+
+def fresh_stored_weather(location_ids):
+    """本地存储中未过期的最新天气：{位置id: WeatherData}"""
+    max_age = timedelta(seconds=current_app.config.get('WEATHER_STORE_MAX_AGE', 1200))
+    cutoff = datetime.utcnow() - max_age
+    return {location_id: record
+            for location_id, record in latest_weather_by_location(location_ids).items()
+            if record.timestamp >= cutoff}
+
+def default_location():
+    """不指定位置时使用的默认牧场：WEATHER_DEFAULT_LOCATION_ID 指定的位置，未配置时为第一个牧场
+
+    没有任何牧场时返回 None，接口退回 WeatherService 的固定坐标。
+    """
+    location_id = current_app.config.get('WEATHER_DEFAULT_LOCATION_ID')
+    if location_id is not None:
+        return db.session.get(RanchLocation, location_id)
+    return RanchLocation.query.order_by(RanchLocation.id).first()
+
+def request_location():
+    """请求参数 location_id 指定的牧场，未指定时为默认牧场"""
+    location_id = request.args.get('location_id', type=int)
+    if location_id is not None:
+        return RanchLocation.query.get_or_404(location_id)
+    return default_location()
+
+def location_info(location):
+    return {
+        'location_id': location.id,
+        'name': location.name,
+        'latitude': location.latitude,
+        'longitude': location.longitude
+    }
+
 @weather_bp.route('/weather')
 @login_required
 def weather_dashboard():
@@ -13,39 +89,35 @@ def weather_dashboard():
 @weather_bp.route('/api/weather/current')
 @login_required
 def get_current_weather():
-    """获取当前天气数据 - 使用固定位置"""
-    weather_data = WeatherService.get_current_weather()
+    """获取当前天气数据 - 指定 location_id 或默认牧场，优先读取本地采集的数据，缺失或过期时实时获取"""
+    location = request_location()
+    if location is None:
+        weather_data = WeatherService.get_current_weather()
+    else:
+        stored = fresh_stored_weather([location.id]).get(location.id)
+        if stored:
+            return jsonify(format_stored_weather(stored))
+        weather_data = WeatherService.get_current_weather(location.latitude, location.longitude)
     
     if weather_data:
         # 提取当前天气数据
-        current = weather_data.get("current", {})
-        weather_code = current.get("weather_code")
-        
-        return jsonify({
-            'temperature': current.get("temperature_2m"),
-            'humidity': current.get("relative_humidity_2m"),
-            'precipitation': current.get("precipitation"),
-            'wind_speed': current.get("wind_speed_10m"),
-            'wind_direction': current.get("wind_direction_10m"),
-            'pressure': current.get("pressure_msl"),
-            'surface_pressure': current.get("surface_pressure"),
-            'cloud_cover': current.get("cloud_cover"),
-            'uv_index': current.get("uv_index"),
-            'visibility': current.get("visibility"),
-            'is_day': current.get("is_day"),
-            'weather_code': weather_code,
-            'weather_description': WeatherService.get_weather_code_description(weather_code)
-        })
+        return jsonify(format_current_weather(weather_data))
     else:
         return jsonify({'error': '无法获取天气数据'}), 404
 
 @weather_bp.route('/api/weather/forecast')
 @login_required
 def get_weather_forecast():
-    """获取天气预报 - 使用固定位置"""
+    """获取天气预报 - 指定 location_id 或默认牧场
+
+    本地只采集当前天气，预报仍向上游获取，由 WeatherService 按 FORECAST_TTL 缓存。
+    """
     days = request.args.get('days', 7, type=int)
-    
-    forecast_data = WeatherService.get_weather_forecast(days)
+    location = request_location()
+    if location is None:
+        forecast_data = WeatherService.get_weather_forecast(days)
+    else:
+        forecast_data = WeatherService.get_weather_forecast(days, location.latitude, location.longitude)
     
     if forecast_data:
         # 添加天气描述
@@ -53,10 +125,68 @@ def get_weather_forecast():
         weather_codes = daily.get('weather_code', [])
         weather_descriptions = [WeatherService.get_weather_code_description(code) for code in weather_codes]
         
-        # 将天气描述添加到结果中
+        # 将天气描述添加到结果中（复制后再修改，避免改动缓存中的数据）
         result = forecast_data.copy()
-        result['daily']['weather_description'] = weather_descriptions
+        result['daily'] = {**daily, 'weather_description': weather_descriptions}
         
         return jsonify(result)
     else:
-        return jsonify({'error': '无法获取天气预报'}), 404
\ No newline at end of file
+        return jsonify({'error': '无法获取天气预报'}), 404
+
+@weather_bp.route('/api/weather/locations/current')
+@login_required
+def get_locations_current_weather():
+    """获取所有牧场位置的当前天气：优先读取本地采集的数据，缺失或过期的位置并发实时获取"""
+    locations = RanchLocation.query.all()
+    stored = fresh_stored_weather([location.id for location in locations])
+    missing = [location for location in locations if location.id not in stored]
+    live = WeatherService.get_locations_current(missing) if missing else {}
+    
+    result = []
+    for location in locations:
+        if location.id in stored:
+            weather = format_stored_weather(stored[location.id])
+        elif live.get(location.id):
+            weather = format_current_weather(live[location.id])
+        else:
+            weather = None
+        result.append({**location_info(location), 'weather': weather})
+    
+    return jsonify(result)
+
+@weather_bp.route('/api/weather/locations/forecast')
+@login_required
+def get_locations_weather_forecast():
+    """并发获取所有牧场位置的天气预报"""
+    days = request.args.get('days', 7, type=int)
+    locations = RanchLocation.query.all()
+    forecast_by_location = WeatherService.get_locations_forecast(locations, days)
+    
+    result = []
+    for location in locations:
+        forecast = forecast_by_location.get(location.id)
+        if forecast:
+            daily = forecast.get('daily', {})
+            descriptions = [WeatherService.get_weather_code_description(code)
+                            for code in daily.get('weather_code', [])]
+            forecast = {**forecast, 'daily': {**daily, 'weather_description': descriptions}}
+        result.append({**location_info(location), 'forecast': forecast})
+    
+    return jsonify(result)
+
+@weather_bp.route('/api/weather/history')
+@login_required
+def get_weather_history():
+    """获取某个牧场位置本地采集的天气历史"""
+    location_id = request.args.get('location_id', type=int)
+    hours = request.args.get('hours', 24, type=int)
+    if location_id is None:
+        return jsonify({'error': '缺少 location_id 参数'}), 400
+    
+    since = datetime.utcnow() - timedelta(hours=hours)
+    records = WeatherData.query.filter(
+        WeatherData.location_id == location_id,
+        WeatherData.timestamp >= since
+    ).order_by(WeatherData.timestamp).all()
+    
+    return jsonify([format_stored_weather(record) for record in records])
\ No newline at end of file
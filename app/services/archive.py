@@ -0,0 +1,190 @@
+"""已封存月份的 Parquet 列式归档
+
+每个已封存的月分区另存一份按 monitor_time 排序、zstd 压缩的 Parquet 文件
+（water_quality_YYYYMM.parquet），每个行组带时间/省份的统计信息。
+长时间范围的分析通过 load_readings()（或流式的 iter_readings()）读取：归档月份用内存映射只读取需要的列，
+时间和省份条件下推到行组过滤；其余月份和热表中的读数仍从 SQLite 查询后拼接。
+
+归档是已封存分区的列式副本：删除分区（drop_before/保留期）时同月的归档文件一并删除，
+统计接口的计数、均值等来自参数累加器，与归档覆盖的读数始终是同一份数据。
+pyarrow 是可选依赖：未安装时 archived_months() 为空，全部查询照旧走 SQLite。
+"""
+import importlib.util
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from ..models import WaterQuality, db
+from .partitions import list_partitions, month_overlaps, water_quality_source, as_datetime
+
+DEFAULT_ARCHIVE_DIR = os.path.join('instance', 'water_quality_archive')
+ARCHIVE_NAME = re.compile(r'^water_quality_(\d{4})(\d{2})\.parquet$')
+
+
+def archive_schema():
+    """与 WaterQuality 字段一一对应的 Arrow 表结构"""
+    import pyarrow as pa
+
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string(), datetime: pa.timestamp('us')}
+    return pa.schema([(c.name, types[c.type.python_type]) for c in WaterQuality.__table__.columns])
+
+
+class ParquetArchive:
+    """按月写入、按需读取 Parquet 归档"""
+
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR, row_group_size=65536, compression='zstd'):
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.enabled = True
+
+    def init_app(self, app):
+        self.directory = app.config.setdefault('WATER_QUALITY_ARCHIVE_DIR', self.directory)
+        self.enabled = app.config.setdefault('WATER_QUALITY_ARCHIVE', self.enabled)
+
+    @property
+    def available(self):
+        return bool(self.enabled) and importlib.util.find_spec('pyarrow') is not None
+
+    def path(self, month):
+        return os.path.join(self.directory, f"water_quality_{month:%Y%m}.parquet")
+
+    def archived_months(self):
+        if not self.available or not os.path.isdir(self.directory):
+            return []
+        months = []
+        for name in os.listdir(self.directory):
+            match = ARCHIVE_NAME.match(name)
+            if match:
+                months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+        return sorted(months)
+
+    def months_for(self, start=None, end=None):
+        """与 [start, end] 有交集的已归档月份"""
+        return [month for month in self.archived_months() if month_overlaps(month, start, end)]
+
+    def write_month(self, connection, month, table):
+        """把一个月分区按时间顺序流式写成 Parquet，先写临时文件再原子替换，返回行数"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = archive_schema()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(month)
+        tmp_path = path + '.tmp'
+        stmt = select(*table.c).order_by(table.c.monitor_time).execution_options(yield_per=self.row_group_size)
+        rows = 0
+        with pq.ParquetWriter(tmp_path, schema, compression=self.compression) as writer:
+            for chunk in connection.execute(stmt).partitions():
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                rows += len(chunk)
+        os.replace(tmp_path, path)
+        return rows
+
+    def refresh(self, connection):
+        """为尚未归档、或封存后又并入了补录读数的月分区重写归档文件，返回 {月份: 行数}"""
+        if not self.available:
+            return {}
+        import pyarrow.parquet as pq
+
+        written = {}
+        for month, table in list_partitions(connection):
+            count = connection.execute(select(func.count()).select_from(table)).scalar()
+            path = self.path(month)
+            if os.path.exists(path) and pq.read_metadata(path).num_rows == count:
+                continue
+            written[month] = self.write_month(connection, month, table)
+        return written
+
+    def drop_before(self, month):
+        """删除 month 之前各月的归档文件，返回删除的月份"""
+        dropped = [archived for archived in self.archived_months() if archived < month]
+        for archived in dropped:
+            os.remove(self.path(archived))
+        return dropped
+
+    @staticmethod
+    def _filters(start=None, end=None, province=None):
+        filters = []
+        if start:
+            filters.append(('monitor_time', '>=', as_datetime(start)))
+        if end:
+            filters.append(('monitor_time', '<=', as_datetime(end)))
+        if province:
+            filters.append(('province', '=', province))
+        return filters
+
+    def read(self, columns, months, start=None, end=None, province=None):
+        """从指定月份的归档中读取 columns 列，时间/省份条件下推到行组过滤，返回 DataFrame"""
+        import pyarrow.parquet as pq
+
+        table = pq.read_table([self.path(month) for month in months], columns=columns,
+                              filters=self._filters(start, end, province) or None, memory_map=True)
+        return table.to_pandas()
+
+    def iter_batches(self, columns, months, start=None, end=None, province=None, batch_size=65536):
+        """逐批读取指定月份归档中的 columns 列，条件同 read()，产出 RecordBatch"""
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        dataset = ds.dataset([self.path(month) for month in months], format='parquet')
+        filters = self._filters(start, end, province)
+        expression = pq.filters_to_expression(filters) if filters else None
+        yield from dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size)
+
+parquet_archive = ParquetArchive()
+
+
+def _recent_readings(columns, months, start_date=None, end_date=None, province=None):
+    """查询未归档部分（热表和未归档的分区）中 columns 列的语句"""
+    source = water_quality_source(start_date, end_date, exclude=set(months))
+    conditions = []
+    if start_date:
+        conditions.append(source.monitor_time >= start_date)
+    if end_date:
+        conditions.append(source.monitor_time <= end_date)
+    if province:
+        conditions.append(source.province == province)
+    return select(*[getattr(source, col) for col in columns]).where(*conditions)
+
+
+def load_readings(columns, start_date=None, end_date=None, province=None):
+    """读取 [start_date, end_date] 内读数的指定列，归档月份读 Parquet，其余部分查 SQLite"""
+    import pandas as pd
+
+    months = parquet_archive.months_for(start_date, end_date)
+    rows = db.session.execute(_recent_readings(columns, months, start_date, end_date, province)).all()
+    recent = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    for col in columns:
+        python_type = WaterQuality.__table__.c[col].type.python_type
+        if python_type is float:
+            recent[col] = recent[col].astype(float)
+        elif python_type is datetime:
+            recent[col] = pd.to_datetime(recent[col])
+
+    if not months:
+        return recent
+    archived = parquet_archive.read(columns, months, start_date, end_date, province)
+    frames = [frame for frame in (archived, recent) if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else recent
+
+
+def iter_readings(columns, start_date=None, end_date=None, province=None, chunk_size=50000):
+    """流式读取 [start_date, end_date] 内读数的数值列，逐块产出 (行数, 列数) 的浮点数组，空值为 NaN
+
+    与 load_readings() 覆盖同一份读数，但同一时刻只有一块数据在内存中。
+    """
+    import numpy as np
+
+    months = parquet_archive.months_for(start_date, end_date)
+    if months:
+        for batch in parquet_archive.iter_batches(columns, months, start_date, end_date, province, chunk_size):
+            if batch.num_rows:
+                yield np.column_stack([column.to_numpy(zero_copy_only=False).astype(float)
+                                       for column in batch.columns])
+    stmt = _recent_readings(columns, months, start_date, end_date, province)
+    for rows in db.session.execute(stmt.execution_options(yield_per=chunk_size)).partitions():
+        yield np.array(rows, dtype=float)
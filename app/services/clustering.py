@@ -0,0 +1,213 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import plotly.express as px
+from plotly.utils import PlotlyJSONEncoder
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+from sqlalchemy import select, func
+
+from ..models import db
+from .partitions import water_quality_source
+from .result_cache import current_data_version
+
+CLUSTER_FEATURES = ['temperature', 'pH', 'dissolved_oxygen', 'conductivity',
+                    'turbidity', 'permanganate_index', 'ammonia_nitrogen']
+
+
+class _ClusterModel:
+    """一次拟合得到的标准化器、聚类器、降维器，以及用于绘图的抽样点"""
+
+    def __init__(self, scaler, kmeans, pca, fitted_count, last_id, data_version):
+        self.scaler = scaler
+        self.kmeans = kmeans
+        self.pca = pca
+        self.fitted_count = fitted_count
+        self.assigned_since_fit = 0
+        self.last_id = last_id
+        self.data_version = data_version
+        self.fitted_at = datetime.now()
+        self.times = np.empty(0, dtype='datetime64[us]')
+        self.coords = np.empty((0, 2))
+        self.labels = np.empty(0, dtype=np.int64)
+
+    def assign(self, times, features):
+        """把新读数归入已有簇，并加入绘图抽样点"""
+        scaled = self.scaler.transform(features)
+        self.times = np.concatenate([self.times, times])
+        self.coords = np.concatenate([self.coords, self.pca.transform(scaled)])
+        self.labels = np.concatenate([self.labels, self.kmeans.predict(scaled)])
+        self.assigned_since_fit += len(features)
+
+    def expire(self, window_start):
+        keep = self.times >= np.datetime64(window_start, 'us')
+        self.times, self.coords, self.labels = self.times[keep], self.coords[keep], self.labels[keep]
+
+    def thin(self, max_points, rng):
+        if len(self.labels) > max_points:
+            keep = np.sort(rng.choice(len(self.labels), max_points, replace=False))
+            self.times, self.coords, self.labels = self.times[keep], self.coords[keep], self.labels[keep]
+
+
+class ClusteringEngine:
+    """最近 window_days 天水质读数的聚类分析
+
+    每个簇数对应一个已拟合模型，记录拟合时的数据版本和最大读数 id。
+    数据版本未变时直接复用结果；有新数据时只对 id 更大的新读数做归类，
+    新增读数超过拟合规模的 refit_ratio 倍或模型超过 refit_interval 后才重新拟合。
+    窗口内读数超过 mini_batch_threshold 时按块流式读取，用 MiniBatchKMeans
+    和 IncrementalPCA 增量拟合，内存只与块大小和绘图点数有关。
+
+    每次拟合都新建 StandardScaler 等对象，模型的读写都在锁内进行，并发请求之间不共享可变状态。
+    """
+
+    def __init__(self, window_days=30, mini_batch_threshold=50000, chunk_size=10000,
+                 max_plot_points=5000, refit_ratio=0.5, refit_interval=timedelta(hours=24)):
+        self.window_days = window_days
+        self.mini_batch_threshold = mini_batch_threshold
+        self.chunk_size = chunk_size
+        self.max_plot_points = max_plot_points
+        self.refit_ratio = refit_ratio
+        self.refit_interval = refit_interval
+        self._models = {}
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(42)
+
+    @staticmethod
+    def _conditions(source, window_start, window_end, after_id=None):
+        conditions = [source.monitor_time >= window_start, source.monitor_time <= window_end]
+        conditions += [getattr(source, f).isnot(None) for f in CLUSTER_FEATURES]
+        if after_id is not None:
+            conditions.append(source.id > after_id)
+        return conditions
+
+    @staticmethod
+    def _columns(source):
+        return [source.id, source.monitor_time] + [getattr(source, f) for f in CLUSTER_FEATURES]
+
+    def _iter_chunks(self, window_start, window_end, after_id=None):
+        """按 id 顺序分块读取 (ids, times, features)，末尾不足一块的零头并入前一块"""
+        source = water_quality_source(window_start, window_end)
+        query = select(*self._columns(source)).where(
+            *self._conditions(source, window_start, window_end, after_id)).order_by(source.id)
+        result = db.session.execute(query.execution_options(yield_per=self.chunk_size))
+
+        pending = None
+        for rows in result.partitions():
+            if pending is not None and len(rows) < self.chunk_size:
+                rows, pending = pending + rows, None
+            if pending is not None:
+                yield self._to_arrays(pending)
+            pending = rows
+        if pending is not None:
+            yield self._to_arrays(pending)
+
+    @staticmethod
+    def _to_arrays(rows):
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        times = np.array([r[1] for r in rows], dtype='datetime64[us]')
+        features = np.array([r[2:] for r in rows], dtype=float)
+        return ids, times, features
+
+    def _sample(self, n):
+        """均匀间隔抽取绘图点的步长"""
+        return max(1, -(-n // self.max_plot_points))
+
+    def _fit(self, n_clusters, window_start, window_end, data_version):
+        source = water_quality_source(window_start, window_end)
+        conditions = self._conditions(source, window_start, window_end)
+        total = db.session.execute(select(func.count(source.id)).where(*conditions)).scalar()
+        if total < n_clusters:
+            return None
+        step = self._sample(total)
+
+        if total <= self.mini_batch_threshold:
+            ids, times, features = self._to_arrays(db.session.execute(
+                select(*self._columns(source)).where(*conditions)).all())
+            # 计数和读取之间数据可能被删除（例如分区过期），读到的行数不足时按无数据处理
+            if len(ids) < n_clusters:
+                return None
+            scaler = StandardScaler()
+            scaled = scaler.fit_transform(features)
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42).fit(scaled)
+            pca = PCA(n_components=2).fit(scaled)
+            model = _ClusterModel(scaler, kmeans, pca, total, int(ids.max()), data_version)
+            model.assign(times[::step], features[::step])
+        else:
+            # 第一遍：标准化参数，同时按步长收集绘图抽样点
+            scaler = StandardScaler()
+            sample_times, sample_features, last_id, offset = [], [], 0, 0
+            for ids, times, features in self._iter_chunks(window_start, window_end):
+                scaler.partial_fit(features)
+                picks = np.arange((-offset) % step, len(ids), step)
+                sample_times.append(times[picks])
+                sample_features.append(features[picks])
+                offset += len(ids)
+                last_id = max(last_id, int(ids.max()))
+            if offset < n_clusters:
+                return None
+
+            # 第二遍：增量拟合聚类和降维
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
+            pca = IncrementalPCA(n_components=2)
+            for _, _, features in self._iter_chunks(window_start, window_end):
+                scaled = scaler.transform(features)
+                kmeans.partial_fit(scaled)
+                pca.partial_fit(scaled)
+            model = _ClusterModel(scaler, kmeans, pca, total, last_id, data_version)
+            model.assign(np.concatenate(sample_times), np.concatenate(sample_features))
+
+        model.assigned_since_fit = 0
+        return model
+
+    def _update(self, model, window_start, window_end, data_version):
+        """只归类上次之后新写入的读数，并移出滑出窗口的抽样点
+
+        监测时间晚于当前时刻的读数不计入，下次重新拟合时再按当时的窗口判断。
+        """
+        model.expire(window_start)
+        for ids, times, features in self._iter_chunks(window_start, window_end, after_id=model.last_id):
+            model.assign(times, features)
+            model.last_id = max(model.last_id, int(ids.max()))
+        model.thin(self.max_plot_points, self._rng)
+        model.data_version = data_version
+
+    def _needs_refit(self, model):
+        return (datetime.now() - model.fitted_at > self.refit_interval or
+                model.assigned_since_fit > model.fitted_count * self.refit_ratio)
+
+    def analyze(self, n_clusters=3):
+        window_end = datetime.now()
+        window_start = window_end - timedelta(days=self.window_days)
+        data_version = current_data_version()
+
+        with self._lock:
+            model = self._models.get(n_clusters)
+            if model is not None and model.data_version != data_version:
+                self._update(model, window_start, window_end, data_version)
+            if model is None or self._needs_refit(model):
+                model = self._fit(n_clusters, window_start, window_end, data_version)
+                if model is None:
+                    self._models.pop(n_clusters, None)
+                    return None
+                self._models[n_clusters] = model
+            else:
+                model.expire(window_start)
+
+            coords, labels = model.coords.copy(), model.labels.copy()
+            centers = model.kmeans.cluster_centers_.tolist()
+            variance = model.pca.explained_variance_ratio_.tolist()
+
+        # 创建散点图
+        fig = px.scatter(x=coords[:, 0], y=coords[:, 1], color=labels,
+                         title='水质数据聚类分析（PCA降维）',
+                         labels={'x': 'PC1', 'y': 'PC2'})
+
+        return {
+            'plot': json.dumps(fig, cls=PlotlyJSONEncoder),
+            'cluster_centers': centers,
+            'explained_variance_ratio': variance
+        }
@@ -1,120 +1,134 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.utils import PlotlyJSONEncoder
+import importlib
 import json
-from datetime import datetime, timedelta
 from sqlalchemy import func
-from ..models import WaterQuality, WeatherData, db
-from scipy import stats
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
-import io
-import base64
+from ..models import NUMERIC_COLUMNS, WaterQuality, db
+from .running_stats import summarize
+from .partitions import water_quality_source
+from .archive import iter_readings, load_readings
+from .downsampling import DOWNSAMPLERS
+
+# pandas / numpy / plotly / scikit-learn 在首次分析时才导入，避免拖慢应用启动；
+# 配置 ANALYSIS_WARMUP 后由 warm_up() 在后台线程中提前加载
+WARMUP_MODULES = ['numpy', 'pandas', 'plotly.graph_objects', 'plotly.express', 'plotly.utils',
+                  __package__ + '.clustering']
+
+
+def warm_up():
+    """预先导入分析用到的重型依赖"""
+    for name in WARMUP_MODULES:
+        importlib.import_module(name)
+
 
 class DataAnalysisService:
     """数据分析服务类"""
     
     def __init__(self):
-        self.scaler = StandardScaler()
+        self._clustering = None
     
-    def get_water_quality_statistics(self, start_date=None, end_date=None, province=None):
-        """获取水质数据统计信息"""
-        query = WaterQuality.query
-        
+    @property
+    def clustering(self):
+        if self._clustering is None:
+            from .clustering import ClusteringEngine
+            self._clustering = ClusteringEngine()
+        return self._clustering
+    
+    @staticmethod
+    def _filter_conditions(start_date=None, end_date=None, province=None, source=WaterQuality):
+        """构建时间范围和省份筛选条件，source 为 water_quality_source() 返回的查询实体"""
+        conditions = []
         if start_date:
-            query = query.filter(WaterQuality.monitor_time >= start_date)
+            conditions.append(source.monitor_time >= start_date)
         if end_date:
-            query = query.filter(WaterQuality.monitor_time <= end_date)
+            conditions.append(source.monitor_time <= end_date)
         if province:
-            query = query.filter(WaterQuality.province == province)
-        
-        data = query.all()
-        
-        if not data:
+            conditions.append(source.province == province)
+        return conditions
+    
+    @staticmethod
+    def _value_counts(column, conditions):
+        """与 pandas value_counts 一致：忽略空值，按数量降序"""
+        count = func.count()
+        rows = db.session.query(column, count).filter(
+            *conditions, column.isnot(None)
+        ).group_by(column).order_by(count.desc()).all()
+        return {value: n for value, n in rows}
+    
+    @staticmethod
+    def _medians(columns, bounds, start_date=None, end_date=None, province=None):
+        """流式读取筛选范围内的各参数列，求忽略空值的中位数
+
+        参数列上没有索引，逐列 ORDER BY ... OFFSET 会对每个参数各排序一次整个范围；
+        这里每遍由 iter_readings 一次扫描全部参数列（归档月份读 Parquet，其余查 SQLite），
+        由 streaming_medians 逐遍缩小中位数所在的区间，内存只与数据块大小有关，
+        不随查询范围的行数增长。bounds 为各列的 (最小值, 最大值)。
+        """
+        from .quantiles import streaming_medians
+        
+        return streaming_medians(lambda: iter_readings(columns, start_date, end_date, province), bounds)
+    
+    def get_water_quality_statistics(self, start_date=None, end_date=None, province=None):
+        """获取水质数据统计信息
+
+        总数、分布和参数统计量在 SQL 中聚合，参数统计量优先读取增量累加器；
+        中位数由有界内存的多遍扫描求出，查询范围涉及已归档的月份时归档部分读 Parquet。
+        """
+        source = water_quality_source(start_date, end_date)
+        conditions = self._filter_conditions(start_date, end_date, province, source)
+        
+        # 总数与时间范围
+        summary = db.session.query(func.count(source.id),
+                                   func.min(source.monitor_time),
+                                   func.max(source.monitor_time)).filter(*conditions).one()
+        
+        total_records = summary[0]
+        if not total_records:
             return None
         
-        # 转换为DataFrame
-        df = pd.DataFrame([{
-            'temperature': d.temperature,
-            'pH': d.pH,
-            'dissolved_oxygen': d.dissolved_oxygen,
-            'conductivity': d.conductivity,
-            'turbidity': d.turbidity,
-            'permanganate_index': d.permanganate_index,
-            'ammonia_nitrogen': d.ammonia_nitrogen,
-            'total_phosphorus': d.total_phosphorus,
-            'total_nitrogen': d.total_nitrogen,
-            'chlorophyll_a': d.chlorophyll_a,
-            'algae_density': d.algae_density,
-            'quality_level': d.quality_level,
-            'monitor_time': d.monitor_time,
-            'province': d.province
-        } for d in data])
-        
-        # 基础统计
-        numeric_columns = ['temperature', 'pH', 'dissolved_oxygen', 'conductivity', 
-                          'turbidity', 'permanganate_index', 'ammonia_nitrogen', 
-                          'total_phosphorus', 'total_nitrogen', 'chlorophyll_a', 'algae_density']
-        
         statistics = {
-            'total_records': len(df),
+            'total_records': total_records,
             'date_range': {
-                'start': df['monitor_time'].min().isoformat() if not df.empty else None,
-                'end': df['monitor_time'].max().isoformat() if not df.empty else None
+                'start': summary[1].isoformat() if summary[1] else None,
+                'end': summary[2].isoformat() if summary[2] else None
             },
-            'quality_distribution': df['quality_level'].value_counts().to_dict(),
-            'province_distribution': df['province'].value_counts().to_dict(),
+            'quality_distribution': self._value_counts(source.quality_level, conditions),
+            'province_distribution': self._value_counts(source.province, conditions),
             'parameter_statistics': {}
         }
         
+        # 均值/标准差/极值来自增量维护的累加器，只有起止月份的零头需要扫描原始读数
+        param_summary = summarize(NUMERIC_COLUMNS, start_date, end_date, province)
+        
+        # 中位数无法由累加器合并，对有读数的参数一次扫描求出
+        present = [col for col in NUMERIC_COLUMNS if col in param_summary]
+        medians = dict(zip(present, self._medians(
+            present, [param_summary[col][3:5] for col in present], start_date, end_date, province)))
+        
         # 各参数统计
-        for col in numeric_columns:
-            if col in df.columns and df[col].notna().any():
-                statistics['parameter_statistics'][col] = {
-                    'mean': float(df[col].mean()),
-                    'median': float(df[col].median()),
-                    'std': float(df[col].std()),
-                    'min': float(df[col].min()),
-                    'max': float(df[col].max()),
-                    'count': int(df[col].count())
-                }
+        for col in present:
+            count, mean, m2, min_val, max_val = param_summary[col]
+            std = (max(m2, 0.0) / (count - 1)) ** 0.5 if count > 1 else float('nan')
+            statistics['parameter_statistics'][col] = {
+                'mean': float(mean),
+                'median': float(medians[col]),
+                'std': float(std),
+                'min': float(min_val),
+                'max': float(max_val),
+                'count': int(count)
+            }
         
         return statistics
     
     def generate_correlation_analysis(self, start_date=None, end_date=None):
         """生成相关性分析"""
-        query = WaterQuality.query
+        import plotly.express as px
+        from plotly.utils import PlotlyJSONEncoder
         
-        if start_date:
-            query = query.filter(WaterQuality.monitor_time >= start_date)
-        if end_date:
-            query = query.filter(WaterQuality.monitor_time <= end_date)
+        # 只读取参与计算的数值列，历史月份来自 Parquet 归档
+        df = load_readings(NUMERIC_COLUMNS, start_date, end_date)
         
-        data = query.all()
-        
-        if len(data) < 2:
+        if len(df) < 2:
             return None
         
-        # 转换为DataFrame
-        df = pd.DataFrame([{
-            'temperature': d.temperature,
-            'pH': d.pH,
-            'dissolved_oxygen': d.dissolved_oxygen,
-            'conductivity': d.conductivity,
-            'turbidity': d.turbidity,
-            'permanganate_index': d.permanganate_index,
-            'ammonia_nitrogen': d.ammonia_nitrogen,
-            'total_phosphorus': d.total_phosphorus,
-            'total_nitrogen': d.total_nitrogen,
-            'chlorophyll_a': d.chlorophyll_a,
-            'algae_density': d.algae_density
-        } for d in data])
-        
         # 计算相关性矩阵
         correlation_matrix = df.corr()
         
@@ -126,94 +140,52 @@ class DataAnalysisService:
         
         return json.dumps(fig, cls=PlotlyJSONEncoder)
     
-    def generate_trend_analysis(self, parameter, start_date=None, end_date=None, province=None):
-        """生成趋势分析"""
-        query = WaterQuality.query
-        
-        if start_date:
-            query = query.filter(WaterQuality.monitor_time >= start_date)
-        if end_date:
-            query = query.filter(WaterQuality.monitor_time <= end_date)
-        if province:
-            query = query.filter(WaterQuality.province == province)
+    def generate_trend_analysis(self, parameter, start_date=None, end_date=None, province=None,
+                                max_points=None, method='lttb'):
+        """生成趋势分析
+
+        max_points 为空时绘制全部读数；否则按 method（lttb / minmax）降采样到不超过该点数，
+        趋势线仍在全部读数上拟合，只在保留的点上取值绘制。
+        """
+        import numpy as np
+        import plotly.graph_objects as go
+        from plotly.utils import PlotlyJSONEncoder
         
-        data = query.order_by(WaterQuality.monitor_time).all()
+        df = load_readings(['monitor_time', parameter], start_date, end_date, province)
+        df = df[df[parameter].notna()].sort_values('monitor_time', kind='stable')
         
-        if not data:
+        if len(df) < 2:
             return None
         
         # 提取数据
-        dates = [d.monitor_time for d in data]
-        values = [getattr(d, parameter) for d in data if getattr(d, parameter) is not None]
-        valid_dates = [dates[i] for i, d in enumerate(data) if getattr(d, parameter) is not None]
+        valid_dates = list(df['monitor_time'].dt.to_pydatetime())
+        values = df[parameter].to_numpy(dtype=float)
         
-        if len(values) < 2:
-            return None
+        # 趋势线在全分辨率数据上拟合
+        positions = np.arange(len(values))
+        trend = np.poly1d(np.polyfit(positions, values, 1))
+        
+        if max_points and max_points < len(values):
+            timestamps = np.array(valid_dates, dtype='datetime64[ns]').astype(np.int64).astype(float)
+            positions = DOWNSAMPLERS[method](timestamps, values, max_points)
+            valid_dates = [valid_dates[i] for i in positions]
+            values = values[positions]
         
         # 创建趋势图
         fig = go.Figure()
         fig.add_trace(go.Scatter(x=valid_dates, y=values, mode='lines+markers', name=parameter))
         
         # 添加趋势线
-        if len(values) > 1:
-            z = np.polyfit(range(len(values)), values, 1)
-            p = np.poly1d(z)
-            fig.add_trace(go.Scatter(x=valid_dates, y=p(range(len(values))), 
-                                   mode='lines', name='趋势线', line=dict(dash='dash')))
+        fig.add_trace(go.Scatter(x=valid_dates, y=trend(positions), 
+                               mode='lines', name='趋势线', line=dict(dash='dash')))
         
         fig.update_layout(title=f'{parameter}趋势分析', xaxis_title='时间', yaxis_title=parameter)
         
         return json.dumps(fig, cls=PlotlyJSONEncoder)
     
     def perform_clustering_analysis(self, n_clusters=3):
-        """执行聚类分析"""
-        # 获取最近一个月的数据
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=30)
-        
-        data = WaterQuality.query.filter(
-            WaterQuality.monitor_time >= start_date,
-            WaterQuality.monitor_time <= end_date
-        ).all()
-        
-        if len(data) < n_clusters:
-            return None
-        
-        # 准备数据
-        features = ['temperature', 'pH', 'dissolved_oxygen', 'conductivity', 
-                   'turbidity', 'permanganate_index', 'ammonia_nitrogen']
-        
-        df = pd.DataFrame([{
-            feature: getattr(d, feature) for feature in features
-        } for d in data])
-        
-        # 删除包含NaN的行
-        df_clean = df.dropna()
-        
-        if len(df_clean) < n_clusters:
-            return None
-        
-        # 标准化数据
-        X_scaled = self.scaler.fit_transform(df_clean)
-        
-        # K-means聚类
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        clusters = kmeans.fit_predict(X_scaled)
-        
-        # PCA降维用于可视化
-        pca = PCA(n_components=2)
-        X_pca = pca.fit_transform(X_scaled)
-        
-        # 创建散点图
-        fig = px.scatter(x=X_pca[:, 0], y=X_pca[:, 1], color=clusters,
-                        title='水质数据聚类分析（PCA降维）',
-                        labels={'x': 'PC1', 'y': 'PC2'})
-        
-        return {
-            'plot': json.dumps(fig, cls=PlotlyJSONEncoder),
-            'cluster_centers': kmeans.cluster_centers_.tolist(),
-            'explained_variance_ratio': pca.explained_variance_ratio_.tolist()
-        }
+        """执行聚类分析（最近30天，模型增量维护）"""
+        return self.clustering.analyze(n_clusters)
     
     def generate_quality_report(self, start_date=None, end_date=None):
         """生成水质报告"""
@@ -0,0 +1,59 @@
+"""时间序列降采样，用于在限定点数内保留趋势图的视觉形状
+
+两种方法都只返回被保留点的下标（升序），调用方据此从原序列中取值。
+numpy 在调用时才导入，路由模块可以直接引用 DOWNSAMPLERS 做参数校验。
+"""
+
+
+def lttb_indices(x, y, max_points):
+    """Largest-Triangle-Three-Buckets 降采样
+
+    首尾两点固定保留，中间各桶选出与前一保留点、后一桶均值构成三角形面积最大的点。
+    """
+    import numpy as np
+
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (max_points - 2)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for i in range(max_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(x, y, max_points):
+    """按桶保留最小值和最大值所在的点，能保住尖峰，适合查看异常值"""
+    import numpy as np
+
+    n = len(y)
+    if max_points >= n or max_points < 2:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    indices = []
+    for bucket in np.array_split(np.arange(n), max_points // 2):
+        values = y[bucket]
+        indices += [bucket[np.argmin(values)], bucket[np.argmax(values)]]
+    return np.unique(indices)
+
+
+DOWNSAMPLERS = {
+    'lttb': lttb_indices,
+    'minmax': minmax_indices,
+}
@@ -0,0 +1,98 @@
+"""结构化水质数据库的筛选项字典（省份 -> 流域 -> 断面）
+
+字典表按 (省份, 流域, 断面) 分组保存行数和时间范围，由 import_waterdata.py 导入结束时重建；
+/api/provinces、/api/basins 等接口只读这张小表，开销与原始数据行数无关。
+"""
+from .structured_schema import PROVINCE_COLUMN, BASIN_COLUMN, SECTION_COLUMN, TIME_COLUMN, quote_identifier
+
+FACET_TABLE = 'water_quality_facets'
+
+
+def refresh_facets(conn):
+    """根据 water_quality 全表重建筛选项字典，缺少的列按空值处理"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(water_quality)")}
+
+    def column(name):
+        return quote_identifier(name) if name in existing else 'NULL'
+
+    conn.execute(f"DROP TABLE IF EXISTS {FACET_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {FACET_TABLE} (
+            province TEXT,
+            basin TEXT,
+            section_name TEXT,
+            row_count INTEGER NOT NULL,
+            first_time TEXT,
+            last_time TEXT
+        )
+    """)
+    conn.execute(f"""
+        INSERT INTO {FACET_TABLE} (province, basin, section_name, row_count, first_time, last_time)
+        SELECT {column(PROVINCE_COLUMN)}, {column(BASIN_COLUMN)}, {column(SECTION_COLUMN)},
+               count(*), min({column(TIME_COLUMN)}), max({column(TIME_COLUMN)})
+        FROM water_quality
+        GROUP BY 1, 2, 3
+    """)
+    conn.execute(f"CREATE INDEX ix_{FACET_TABLE}_province_basin ON {FACET_TABLE} (province, basin)")
+    conn.commit()
+    return conn.execute(f"SELECT count(*) FROM {FACET_TABLE}").fetchone()[0]
+
+
+def has_facets(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (FACET_TABLE,)).fetchone() is not None
+
+
+def list_provinces(conn):
+    if not has_facets(conn):
+        return [row[0] for row in conn.execute(f"SELECT DISTINCT {PROVINCE_COLUMN} FROM water_quality")]
+    return [row[0] for row in conn.execute(f"SELECT DISTINCT province FROM {FACET_TABLE} ORDER BY province")]
+
+
+def list_basins(conn, province=None):
+    if not has_facets(conn):
+        sql = f"SELECT DISTINCT {BASIN_COLUMN} FROM water_quality"
+        if province:
+            return [row[0] for row in conn.execute(sql + f" WHERE {PROVINCE_COLUMN} = ?", (province,))]
+        return [row[0] for row in conn.execute(sql)]
+    if province:
+        cursor = conn.execute(f"SELECT DISTINCT basin FROM {FACET_TABLE} WHERE province = ? ORDER BY basin",
+                              (province,))
+    else:
+        cursor = conn.execute(f"SELECT DISTINCT basin FROM {FACET_TABLE} ORDER BY basin")
+    return [row[0] for row in cursor]
+
+
+def _merge_bounds(node, count, first_time, last_time):
+    node['count'] += count
+    if first_time is not None and (node['first_time'] is None or first_time < node['first_time']):
+        node['first_time'] = first_time
+    if last_time is not None and (node['last_time'] is None or last_time > node['last_time']):
+        node['last_time'] = last_time
+
+
+def build_facet_tree(rows):
+    """把按省份、流域、断面排序的 (省份, 流域, 断面, 行数, 最早时间, 最晚时间) 组织成嵌套列表，每层带行数和时间范围"""
+    provinces = {}
+    for province, basin, section, count, first_time, last_time in rows:
+        province_node = provinces.setdefault(province, {
+            'province': province, 'count': 0, 'first_time': None, 'last_time': None, 'basins': {}})
+        basin_node = province_node['basins'].setdefault(basin, {
+            'basin': basin, 'count': 0, 'first_time': None, 'last_time': None, 'sections': []})
+        basin_node['sections'].append({
+            'section_name': section, 'count': count, 'first_time': first_time, 'last_time': last_time})
+        _merge_bounds(basin_node, count, first_time, last_time)
+        _merge_bounds(province_node, count, first_time, last_time)
+
+    for province_node in provinces.values():
+        province_node['basins'] = list(province_node['basins'].values())
+    return list(provinces.values())
+
+
+def facet_tree(conn):
+    """返回结构化库的筛选项嵌套列表；字典表不存在时返回 None"""
+    if not has_facets(conn):
+        return None
+    return build_facet_tree(conn.execute(
+        f"SELECT province, basin, section_name, row_count, first_time, last_time "
+        f"FROM {FACET_TABLE} ORDER BY province, basin, section_name"))
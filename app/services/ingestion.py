@@ -0,0 +1,207 @@
+from sqlalchemy import func, insert, select, text
+from ..models import NUMERIC_COLUMNS, WaterQuality
+from .rollup import update_rollups
+from .running_stats import update_running_statistics
+from .station_latest import update_station_latest
+from .typed_facets import update_typed_facets
+from .result_cache import bump_data_version
+from .partitions import list_partitions
+
+# WaterQuality 中除主键外的全部字段
+TEXT_COLUMNS = ['province', 'basin', 'section_name', 'quality_level', 'station_status']
+TIME_COLUMN = 'monitor_time'
+INSERT_COLUMNS = ['province', 'basin', 'section_name', TIME_COLUMN, 'quality_level'] + \
+    NUMERIC_COLUMNS + ['station_status']
+
+REQUIRED_COLUMNS = ['monitor_time', 'province', 'section_name']
+
+# 单次响应中最多返回的错误行明细数量，计数不受影响
+MAX_REPORTED_ERRORS = 1000
+
+
+class IngestResult:
+    """一次导入的结果：成功/失败计数以及按数据块归类的错误行"""
+
+    def __init__(self):
+        self.success_count = 0
+        self.error_count = 0
+        self.errors = []
+        self._reported = 0
+
+    def add_errors(self, chunk_no, rows):
+        """记录某个数据块中的错误行，rows 为 (行号, 原因) 列表"""
+        if not rows:
+            return
+        self.error_count += len(rows)
+        room = MAX_REPORTED_ERRORS - self._reported
+        if room <= 0:
+            return
+        reported = [{'row': row, 'reason': reason} for row, reason in rows[:room]]
+        self._reported += len(reported)
+        self.errors.append({'chunk': chunk_no, 'rows': reported})
+
+    def to_dict(self):
+        return {
+            'success_count': self.success_count,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > self._reported
+        }
+
+
+def last_inserted_id(connection):
+    return connection.execute(text("SELECT max(id) FROM water_quality")).scalar()
+
+
+def after_insert(connection, first_id, last_id, table='water_quality'):
+    """新读数写入后、事务提交前，同步维护各派生数据；table 为读数所在的表（热表或月分区）"""
+    if first_id is None or last_id is None or last_id < first_id:
+        return
+    update_rollups(connection, first_id, last_id, table)
+    update_running_statistics(connection, first_id, last_id, table)
+    update_station_latest(connection, first_id, last_id, table)
+    update_typed_facets(connection, first_id, last_id, table)
+    bump_data_version(connection)
+
+
+# 由原始读数派生、写入时增量维护的表
+DERIVED_TABLES = ['water_quality_rollup', 'parameter_statistics', 'station_latest', 'water_quality_facet']
+
+
+def rebuild_derived(connection):
+    """清空并根据全部原始读数（热表和各月分区）重建各派生数据"""
+    for table in DERIVED_TABLES:
+        connection.execute(text(f"DELETE FROM {table}"))
+    for table in [WaterQuality.__table__] + [partition for _, partition in list_partitions(connection)]:
+        first_id, last_id = connection.execute(select(func.min(table.c.id), func.max(table.c.id))).one()
+        after_insert(connection, first_id, last_id, table.name)
+
+
+class WaterQualityIngestor:
+    """水质数据批量导入引擎
+
+    列映射只做一次，时间和数值列使用向量化解析，
+    然后按块用 Core insert() 批量写入，整个导入在调用方的同一个事务中完成。
+    """
+
+    def __init__(self, chunk_size=5000):
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def map_columns(df):
+        """将文件列名映射为模型字段名（去除空白，大小写不敏感）"""
+        lookup = {col.lower(): col for col in INSERT_COLUMNS}
+        mapping = {}
+        for col in df.columns:
+            key = str(col).strip()
+            target = lookup.get(key.lower())
+            if target and target not in mapping.values():
+                mapping[col] = target
+        return df.rename(columns=mapping)[list(mapping.values())]
+
+    @staticmethod
+    def missing_columns(df):
+        return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+    def prepare(self, df):
+        """向量化清洗数据，返回 (可写入的DataFrame, 错误行列表)
+
+        错误行以 (行号, 原因) 表示，行号为数据行序号（从1开始，不含表头）。
+        """
+        import pandas as pd
+
+        df = self.map_columns(df).reset_index(drop=True)
+        row_numbers = pd.Series(range(1, len(df) + 1))
+        reasons = pd.Series([None] * len(df), dtype=object)
+
+        # 时间列：先按统一格式快速解析，失败的再逐个按混合格式兜底
+        raw_time = df[TIME_COLUMN]
+        monitor_time = pd.to_datetime(raw_time, errors='coerce')
+        retry = monitor_time.isna() & raw_time.notna()
+        if retry.any():
+            monitor_time[retry] = pd.to_datetime(raw_time[retry].astype(str), errors='coerce', format='mixed')
+        reasons[monitor_time.isna()] = '监测时间无效'
+        df[TIME_COLUMN] = monitor_time
+
+        for col in NUMERIC_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+                continue
+            raw = df[col]
+            values = pd.to_numeric(raw, errors='coerce')
+            # 只对解析失败且非空的少数单元格再判断是否为空白字符串
+            suspect = values.isna() & raw.notna() & reasons.isna()
+            if suspect.any():
+                invalid = raw[suspect].astype(str).str.strip() != ''
+                reasons[invalid[invalid].index] = f'{col} 不是有效数值'
+            df[col] = values
+
+        for col in TEXT_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+            elif not pd.api.types.is_string_dtype(df[col]):
+                df[col] = df[col].map(str, na_action='ignore')
+
+        bad = reasons.notna()
+        errors = list(zip(row_numbers[bad].tolist(), reasons[bad].tolist()))
+        clean = df.loc[~bad, INSERT_COLUMNS]
+        clean.index = row_numbers[~bad]
+        return clean, errors
+
+    @staticmethod
+    def _to_rows(chunk, columns):
+        """将数据块转换为 executemany 所需的元组列表，NaN/NaT 统一转为 None
+
+        时间按 SQLAlchemy 的 SQLite DateTime 存储格式预先格式化，
+        从而绕过逐值的绑定参数处理。
+        """
+        chunk = chunk[columns].copy()
+        chunk[TIME_COLUMN] = chunk[TIME_COLUMN].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+        chunk = chunk.astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        return list(chunk.itertuples(index=False, name=None))
+
+    @staticmethod
+    def insert_records(connection, records):
+        """写入一批已清洗好的记录（字段名与 WaterQuality 一致的字典列表）"""
+        if records:
+            connection.execute(insert(WaterQuality.__table__), records)
+            # 同一事务内持有写锁，新行的 id 连续分配
+            last_id = last_inserted_id(connection)
+            after_insert(connection, last_id - len(records) + 1, last_id)
+        return len(records)
+
+    def ingest(self, df, connection):
+        """在给定连接的当前事务中批量导入 DataFrame
+
+        校验失败的行按所在数据块记录到结果中；写入阶段的数据库异常直接抛出，
+        由调用方回滚整个事务。
+        """
+        result = IngestResult()
+        clean, errors = self.prepare(df)
+
+        # 预处理阶段的错误按其所在数据块归类
+        chunk_errors = {}
+        for row, reason in errors:
+            chunk_errors.setdefault((row - 1) // self.chunk_size, []).append((row, reason))
+
+        compiled = insert(WaterQuality.__table__).compile(
+            dialect=connection.dialect, column_keys=INSERT_COLUMNS)
+        columns = list(compiled.positiontup)
+        first_id = None
+        n_chunks = (len(df) + self.chunk_size - 1) // self.chunk_size
+        for chunk_no in range(n_chunks):
+            # clean 的索引即递增的行号，按块边界二分切片
+            lo, hi = clean.index.searchsorted([chunk_no * self.chunk_size + 1,
+                                               (chunk_no + 1) * self.chunk_size + 1])
+            chunk = clean.iloc[lo:hi]
+            if not chunk.empty:
+                connection.exec_driver_sql(str(compiled), self._to_rows(chunk, columns))
+                if first_id is None:
+                    first_id = last_inserted_id(connection) - len(chunk) + 1
+                result.success_count += len(chunk)
+            result.add_errors(chunk_no + 1, chunk_errors.get(chunk_no, []))
+
+        if result.success_count:
+            after_insert(connection, first_id, last_inserted_id(connection))
+        return result
@@ -0,0 +1,103 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """一个后台分析任务的状态：pending -> running -> done / failed"""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['message'] = self.error
+        return data
+
+
+class JobManager:
+    """基于本地线程池的后台任务执行器
+
+    相同 key 的任务在执行中时不会重复提交，而是返回已有任务；
+    已结束的任务在 result_ttl 秒内可以查询结果，之后被清理。
+    任务在应用上下文中运行，可以直接使用 db.session。
+    """
+
+    def __init__(self, max_workers=4, result_ttl=600):
+        self.app = None
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.setdefault('ANALYSIS_JOB_WORKERS', self.max_workers)
+        self.result_ttl = app.config.setdefault('ANALYSIS_JOB_TTL', self.result_ttl)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='analysis-job')
+        return self._executor
+
+    def submit(self, key, func):
+        """提交任务，返回 (任务, 是否新建)"""
+        with self._lock:
+            self._expire()
+            job = self._inflight.get(key)
+            if job is not None:
+                return job, False
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+        self.executor.submit(self._run, job, func)
+        return job, True
+
+    def _run(self, job, func):
+        job.status = 'running'
+        try:
+            with self.app.app_context():
+                job.result = func()
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._inflight.pop(job.key, None)
+
+    def _expire(self):
+        deadline = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < deadline]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+job_manager = JobManager()
@@ -0,0 +1,187 @@
+"""水质读数的按月分区
+
+新读数始终写入 water_quality（热表），已结束的月份由 PartitionManager.seal() 整月搬到
+water_quality_pYYYYMM 分区表；过期数据按分区 DROP TABLE，不再逐行删除。
+查询通过 water_quality_source() 按 monitor_time 范围只拼接相关分区，热表始终参与，
+因此归档后补录到热表的旧读数同样可以查到，下次封存时再并入对应分区。
+
+日/小时汇总、参数累加器、断面最新状态和筛选项字典在写入时维护，封存不会改动它们；
+drop_before() 在同一事务中删掉被删月份的汇总和累加器，并修正断面最新状态和筛选项字典，
+派生数据与剩余的原始读数始终一致。
+"""
+import re
+import threading
+from datetime import datetime, date
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, text, union_all
+from sqlalchemy.orm import aliased
+
+from ..models import ParameterStatistics, StationLatest, WaterQuality, WaterQualityRollup, db
+from .result_cache import bump_data_version
+from .typed_facets import trim_typed_facets
+
+PARTITION_PREFIX = 'water_quality_p'
+PARTITION_NAME = re.compile(r'^water_quality_p(\d{4})(\d{2})$')
+
+_metadata = MetaData()
+_metadata_lock = threading.Lock()
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def as_datetime(value):
+    """筛选条件中的时间可能是 datetime、date 或 ISO 字符串"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def partition_table(name):
+    """与 WaterQuality 同结构、同索引的分区表定义"""
+    with _metadata_lock:
+        if name not in _metadata.tables:
+            source = WaterQuality.__table__
+            table = Table(name, _metadata, *[
+                Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in source.columns])
+            for index in source.indexes:
+                Index(index.name.replace(source.name, name, 1), *[table.c[c.name] for c in index.columns])
+        return _metadata.tables[name]
+
+
+def list_partitions(connection):
+    """已封存的分区：按月份排序的 [(月份, Table)]"""
+    rows = connection.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'water_quality_p[0-9]*'"))
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((datetime(int(match.group(1)), int(match.group(2)), 1), partition_table(name)))
+    return sorted(partitions, key=lambda item: item[0])
+
+
+def month_overlaps(month, start=None, end=None):
+    """month 所在整月是否与 [start, end] 有交集"""
+    start, end = as_datetime(start), as_datetime(end)
+    return (start is None or _next_month(month) > start) and (end is None or month <= end)
+
+
+def prune_partitions(partitions, start=None, end=None):
+    """只保留与 [start, end] 有交集的分区"""
+    return [(month, table) for month, table in partitions if month_overlaps(month, start, end)]
+
+
+def water_quality_source(start=None, end=None, exclude=()):
+    """返回覆盖 monitor_time 在 [start, end] 内读数的查询实体，用法与 WaterQuality 相同
+
+    没有相关分区时直接返回 WaterQuality；否则返回映射到“热表 + 相关分区” UNION ALL 的别名，
+    外层的筛选条件会被 SQLite 下推到每个分区，各自使用分区上的索引。
+    exclude 中的月份（例如已由 Parquet 归档提供的月份）不参与拼接。
+    """
+    tables = [table for month, table in prune_partitions(list_partitions(db.session.connection()), start, end)
+              if month not in exclude]
+    if not tables:
+        return WaterQuality
+    source = WaterQuality.__table__
+    union = union_all(*[select(*[t.c[c.name] for c in source.columns]) for t in [source] + tables])
+    return aliased(WaterQuality, union.subquery('water_quality_all'), adapt_on_names=True)
+
+
+class PartitionManager:
+    """封存已结束的月份、按保留期删除过期分区"""
+
+    def __init__(self, retention_months=None):
+        self.retention_months = retention_months
+
+    def init_app(self, app):
+        # 原始读数保留的月数，None 表示永久保留
+        self.retention_months = app.config.setdefault('WATER_QUALITY_RETENTION_MONTHS', self.retention_months)
+
+    @staticmethod
+    def sealable_months(connection, before):
+        """热表中早于 before 的月份
+
+        water_quality 是 AUTOINCREMENT 表（旧库由 migrations.upgrade_autoincrement 转换），
+        包括最大 id 在内的任何读数移出热表后，其 id 都不会被再次分配。
+        """
+        source = WaterQuality.__table__
+        month = func.strftime('%Y-%m', source.c.monitor_time)
+        months = connection.execute(
+            select(month).distinct().where(source.c.monitor_time < before)).scalars().all()
+        return [datetime.strptime(month, '%Y-%m') for month in sorted(months)]
+
+    def seal(self, connection, before=None):
+        """把 before（默认本月初）之前的整月读数从热表搬到各自的分区，返回 {分区名: 行数}"""
+        before = _month_start(as_datetime(before) or datetime.now())
+        source = WaterQuality.__table__
+        moved = {}
+        for month in self.sealable_months(connection, before):
+            table = partition_table(partition_name(month))
+            table.create(connection, checkfirst=True)
+            in_month = [source.c.monitor_time >= month, source.c.monitor_time < _next_month(month)]
+            connection.execute(insert(table).from_select(
+                [c.name for c in source.columns], select(*source.columns).where(*in_month)))
+            moved[table.name] = connection.execute(delete(source).where(*in_month)).rowcount
+        return moved
+
+    def drop_before(self, connection, month):
+        """删除 month 之前的全部原始读数：分区整表 DROP，热表中补录的零星旧读数逐行删除"""
+        month = _month_start(as_datetime(month))
+        dropped, remaining = [], [WaterQuality.__tablename__]
+        for partition_month, table in list_partitions(connection):
+            if partition_month < month:
+                table.drop(connection)
+                dropped.append(table.name)
+            else:
+                remaining.append(table.name)
+        source = WaterQuality.__table__
+        late = connection.execute(delete(source).where(source.c.monitor_time < month)).rowcount
+        if dropped or late:
+            self._trim_derived(connection, month, remaining)
+            bump_data_version(connection)
+        return dropped
+
+    @staticmethod
+    def _trim_derived(connection, month, remaining):
+        """删除 month 之前的汇总和累加器，修正断面最新状态和筛选项字典
+
+        汇总和累加器按时间桶/月份存储，直接按键删除；断面最新读数早于 month 的断面已没有读数，
+        删除即可；筛选项字典从剩余的表重新计数。
+        """
+        rollup = WaterQualityRollup.__table__
+        connection.execute(delete(rollup).where(rollup.c.bucket < f"{month:%Y-%m-%d}"))
+        statistics = ParameterStatistics.__table__
+        connection.execute(delete(statistics).where(statistics.c.month < f"{month:%Y-%m}"))
+        latest = StationLatest.__table__
+        connection.execute(delete(latest).where(latest.c.monitor_time < month))
+        trim_typed_facets(connection, month, remaining)
+
+    def retention_cutoff(self, now=None):
+        """按 retention_months 计算的保留起始月份，未配置保留期时为 None"""
+        if not self.retention_months:
+            return None
+        current = _month_start(as_datetime(now) or datetime.now())
+        index = current.year * 12 + current.month - 1 - self.retention_months
+        return datetime(index // 12, index % 12 + 1, 1)
+
+    def apply_retention(self, connection, now=None):
+        """按 retention_months 删除过期分区，未配置保留期时不做任何事"""
+        cutoff = self.retention_cutoff(now)
+        if cutoff is None:
+            return []
+        return self.drop_before(connection, cutoff)
+
+
+partition_manager = PartitionManager()
@@ -0,0 +1,110 @@
+"""智能问答的上下文数据
+
+问答接口需要的水质、趋势、鱼类、设备、环境数据保存在定期刷新的内存快照中，
+每个问题只做一次关键词匹配并从快照中取数，耗时与数据库规模无关。
+"""
+import re
+import threading
+import time
+
+from .result_cache import current_data_version
+
+# 意图 -> 触发关键词
+INTENT_KEYWORDS = {
+    'water_quality': ['水质', 'pH', '温度', '溶解氧', '浊度', '电导率'],
+    'fish_data': ['鱼', '鱼类', '养殖', '产量', '生长'],
+    'equipment': ['设备', '传感器', '摄像头', '维护'],
+    'environment': ['环境', '天气', '气温', '湿度'],
+}
+
+# 意图 -> 需要放入上下文的数据项
+INTENT_SOURCES = {
+    'water_quality': ['water_quality', 'water_trend'],
+    'fish_data': ['fish_data'],
+    'equipment': ['equipment'],
+    'environment': ['environment'],
+}
+
+
+def compile_intent_pattern(intent_keywords):
+    """把全部关键词编译成一个正则，每个意图一个命名分组
+
+    整体放在零宽先行断言中，每个位置都会尝试匹配，关键词之间的重叠不会互相遮挡。
+    """
+    groups = ['(?P<{}>{})'.format(intent, '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+              for intent, keywords in intent_keywords.items()]
+    return re.compile('(?=' + '|'.join(groups) + ')')
+
+
+class QAContextProvider:
+    """问答上下文提供者
+
+    数据源通过 @qa_context.source(名称) 注册；快照超过 refresh_interval 秒，
+    或水质数据版本（写入读数、封存或删除分区时递增）与建快照时不同后，
+    由第一个发现过期的请求重建，其他请求在重建期间继续使用旧快照。
+    数据版本保存在数据库中，多个工作进程各自的快照都能及时发现新数据。
+    """
+
+    def __init__(self, refresh_interval=60):
+        self.refresh_interval = refresh_interval
+        self.pattern = compile_intent_pattern(INTENT_KEYWORDS)
+        self._sources = {}
+        self._snapshot = None
+        self._version = None
+        self._refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.setdefault('QA_CONTEXT_REFRESH_INTERVAL', self.refresh_interval)
+
+    def source(self, name):
+        """注册一个数据源，被装饰的函数无参数、返回该数据项"""
+        def decorator(func):
+            self._sources[name] = func
+            return func
+        return decorator
+
+    def match_intents(self, question):
+        intents = set()
+        for match in self.pattern.finditer(question):
+            intents.add(match.lastgroup)
+            if len(intents) == len(INTENT_KEYWORDS):
+                break
+        return intents
+
+    def refresh(self, version=None):
+        """重新读取全部数据源，返回新快照；version 为读取前的数据版本"""
+        snapshot = {name: func() for name, func in self._sources.items()}
+        self._snapshot = snapshot
+        self._version = version
+        self._refreshed_at = time.monotonic()
+        return snapshot
+
+    def snapshot(self):
+        version = current_data_version()
+        snapshot = self._snapshot
+        if (snapshot is not None and self._version == version
+                and time.monotonic() - self._refreshed_at < self.refresh_interval):
+            return snapshot
+        # 已有快照时不等待，让正在刷新的请求完成即可
+        if not self._refresh_lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is not snapshot and self._snapshot is not None:
+                return self._snapshot
+            return self.refresh(version)
+        finally:
+            self._refresh_lock.release()
+
+    def get_context(self, question):
+        """根据问题中的意图从快照中取出相关数据"""
+        intents = self.match_intents(question)
+        if not intents:
+            return {}
+        snapshot = self.snapshot()
+        return {name: snapshot[name]
+                for intent in INTENT_KEYWORDS if intent in intents
+                for name in INTENT_SOURCES[intent] if name in snapshot}
+
+
+qa_context = QAContextProvider()
@@ -0,0 +1,82 @@
+"""有界内存的精确中位数
+
+参数列上没有索引，而把整个范围的读数读进内存再求中位数，内存会随时间范围线性增长。
+这里对每一列维护一个包含中位数的取值区间，每一遍流式扫描全部列：
+区间内的值预计不多于 max_buffer 个时直接收集并排序取值，否则在区间上统计 bins 个桶的直方图，
+把区间缩小到中位数所在的桶。通常两遍即可得到与 numpy.nanmedian 相同的结果，
+内存只与数据块大小、bins 和 max_buffer 有关。
+"""
+
+
+def streaming_medians(read_chunks, bounds, bins=4096, max_buffer=65536, max_passes=8):
+    """各列忽略空值的中位数
+
+    read_chunks() 每调用一次重新流式读取一遍数据，产出形状为 (行数, 列数) 的浮点数组，空值为 NaN；
+    bounds 为各列的 (最小值, 最大值)，用作第一遍直方图的范围。
+    两遍之间如有新数据写入导致中位数落到区间之外，该列按本遍实际的取值范围重新开始。
+    """
+    import numpy as np
+
+    k = len(bounds)
+    lo = np.array([low for low, _ in bounds], dtype=float)
+    hi = np.array([high for _, high in bounds], dtype=float)
+    expected = np.full(k, np.inf)  # 区间内预计的值数，决定本遍收集还是统计直方图
+    medians = np.full(k, np.nan)
+    pending = list(range(k))
+
+    for n_pass in range(max_passes + 1):
+        if not pending:
+            break
+        collect = {j: n_pass == max_passes or expected[j] <= max_buffer for j in pending}
+        edges = {j: np.linspace(lo[j], hi[j], bins + 1) for j in pending if not collect[j]}
+        hist = {j: np.zeros(bins, dtype=np.int64) for j in edges}
+        values = {j: [] for j in pending if collect[j]}
+        total = np.zeros(k, dtype=np.int64)
+        below = np.zeros(k, dtype=np.int64)
+        seen_min = np.full(k, np.inf)
+        seen_max = np.full(k, -np.inf)
+
+        for chunk in read_chunks():
+            for j in pending:
+                column = chunk[:, j]
+                column = column[~np.isnan(column)]
+                if not column.size:
+                    continue
+                total[j] += column.size
+                seen_min[j] = min(seen_min[j], column.min())
+                seen_max[j] = max(seen_max[j], column.max())
+                below[j] += np.count_nonzero(column < lo[j])
+                inside = column[(column >= lo[j]) & (column <= hi[j])]
+                if collect[j]:
+                    values[j].append(inside)
+                else:
+                    index = np.searchsorted(edges[j], inside, side='right') - 1
+                    index[index == bins] = bins - 1  # 等于区间上界的值归入最后一个桶
+                    hist[j] += np.bincount(index, minlength=bins)
+
+        for j in list(pending):
+            n = int(total[j])
+            if n == 0:
+                pending.remove(j)
+                continue
+            # 中位数是第 (n-1)//2 和第 n//2 小的值的均值，换算为区间内的名次
+            ranks = np.array([(n - 1) // 2, n // 2]) - below[j]
+            if collect[j]:
+                inside = np.sort(np.concatenate(values[j])) if values[j] else np.empty(0)
+                if ranks[0] >= 0 and ranks[1] < inside.size:
+                    medians[j] = (inside[ranks[0]] + inside[ranks[1]]) / 2
+                    pending.remove(j)
+                    continue
+            else:
+                cumulative = np.cumsum(hist[j])
+                if ranks[0] >= 0 and ranks[1] < cumulative[-1]:
+                    if lo[j] == hi[j]:
+                        medians[j] = lo[j]
+                        pending.remove(j)
+                        continue
+                    first, last = np.searchsorted(cumulative, ranks, side='right')
+                    expected[j] = cumulative[last] - (cumulative[first - 1] if first else 0)
+                    lo[j], hi[j] = edges[j][first], edges[j][last + 1]
+                    continue
+            lo[j], hi[j], expected[j] = seen_min[j], seen_max[j], np.inf
+    return medians
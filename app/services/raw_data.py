@@ -0,0 +1,138 @@
+"""原始水质数据接口（/api/water_quality_data 等）的存储后端
+
+structured：import_waterdata.py 生成的结构化库，列名为中文；
+typed：ocean.db 中带类型的 WaterQuality 表及其月分区（由 migrate_structured_db.py 迁移而来），
+按 TYPED_COLUMN_MAP 以结构化库的中文列名对外返回，前端无需改动。
+由配置 WATER_DATA_BACKEND 选择。
+"""
+from flask import current_app
+from sqlalchemy import select, func
+
+from ..models import db
+from . import facets
+from .partitions import water_quality_source
+from .result_cache import current_data_version
+from .structured_db import structured_db
+from .structured_schema import PROVINCE_COLUMN, BASIN_COLUMN, TIME_COLUMN, TIME_FORMAT, TYPED_COLUMN_MAP
+from .typed_facets import facet_rows
+
+
+class StructuredRawData:
+    """结构化库（只读连接池）"""
+
+    name = 'structured'
+
+    @staticmethod
+    def _where(province=None, basin=None):
+        filters, params = [], []
+        if province:
+            filters.append(f"{PROVINCE_COLUMN} = ?")
+            params.append(province)
+        if basin:
+            filters.append(f"{BASIN_COLUMN} = ?")
+            params.append(basin)
+        return filters, params
+
+    @staticmethod
+    def data_version():
+        """库文件变化的标识，用于缓存总行数"""
+        return structured_db.data_version()
+
+    def fetch_after(self, last_id, limit, province=None, basin=None):
+        """id 大于 last_id 的前 limit 行，按 id 排序"""
+        filters, params = self._where(province, basin)
+        sql = "SELECT * FROM water_quality WHERE " + " AND ".join(filters + ["id > ?"]) + " ORDER BY id LIMIT ?"
+        return [dict(row) for row in structured_db.get().execute(sql, params + [last_id, limit])]
+
+    def fetch_page(self, offset, limit, province=None, basin=None):
+        filters, params = self._where(province, basin)
+        where_clause = " WHERE " + " AND ".join(filters) if filters else ""
+        sql = "SELECT * FROM water_quality" + where_clause + " LIMIT ? OFFSET ?"
+        return [dict(row) for row in structured_db.get().execute(sql, params + [limit, offset])]
+
+    def count(self, province=None, basin=None):
+        filters, params = self._where(province, basin)
+        where_clause = " WHERE " + " AND ".join(filters) if filters else ""
+        return structured_db.get().execute("SELECT COUNT(*) FROM water_quality" + where_clause, params).fetchone()[0]
+
+    def provinces(self):
+        return facets.list_provinces(structured_db.get())
+
+    def basins(self, province=None):
+        return facets.list_basins(structured_db.get(), province)
+
+    def facet_tree(self):
+        return facets.facet_tree(structured_db.get())
+
+
+class TypedRawData:
+    """主库 WaterQuality 表（含已封存的月分区），按中文列名返回"""
+
+    name = 'typed'
+
+    @staticmethod
+    def _columns(source):
+        return [source.id.label('id')] + \
+            [getattr(source, field).label(name) for name, field in TYPED_COLUMN_MAP.items()]
+
+    @staticmethod
+    def _where(source, province=None, basin=None):
+        conditions = []
+        if province:
+            conditions.append(source.province == province)
+        if basin:
+            conditions.append(source.basin == basin)
+        return conditions
+
+    @staticmethod
+    def _to_dict(row):
+        record = dict(row._mapping)
+        if record[TIME_COLUMN] is not None:
+            record[TIME_COLUMN] = record[TIME_COLUMN].strftime(TIME_FORMAT)
+        return record
+
+    @staticmethod
+    def data_version():
+        """主库的数据版本，写入读数、封存或删除分区时递增"""
+        return current_data_version()
+
+    def fetch_after(self, last_id, limit, province=None, basin=None):
+        source = water_quality_source()
+        stmt = select(*self._columns(source)).where(*self._where(source, province, basin), source.id > last_id) \
+            .order_by(source.id).limit(limit)
+        return [self._to_dict(row) for row in db.session.execute(stmt)]
+
+    def fetch_page(self, offset, limit, province=None, basin=None):
+        source = water_quality_source()
+        stmt = select(*self._columns(source)).where(*self._where(source, province, basin)) \
+            .order_by(source.id).limit(limit).offset(offset)
+        return [self._to_dict(row) for row in db.session.execute(stmt)]
+
+    def count(self, province=None, basin=None):
+        source = water_quality_source()
+        return db.session.execute(
+            select(func.count(source.id)).where(*self._where(source, province, basin))).scalar()
+
+    def provinces(self):
+        return list(dict.fromkeys(row[0] for row in facet_rows()))
+
+    def basins(self, province=None):
+        return sorted({row[1] for row in facet_rows(province)}, key=lambda b: (b is not None, b or ''))
+
+    def facet_tree(self):
+        return facets.build_facet_tree(
+            (p, b, s, n,
+             first.strftime(TIME_FORMAT) if first else None,
+             last.strftime(TIME_FORMAT) if last else None)
+            for p, b, s, n, first, last in facet_rows())
+
+
+RAW_DATA_BACKENDS = {
+    StructuredRawData.name: StructuredRawData(),
+    TypedRawData.name: TypedRawData(),
+}
+
+
+def raw_data_backend():
+    """当前应用配置的原始数据后端"""
+    return RAW_DATA_BACKENDS[current_app.config.get('WATER_DATA_BACKEND', StructuredRawData.name)]
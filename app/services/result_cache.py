@@ -0,0 +1,108 @@
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from sqlalchemy import text
+from ..models import DataVersion, db
+
+WATER_QUALITY_VERSION = 'water_quality'
+
+_BUMP_SQL = text("""
+INSERT INTO data_version (name, version) VALUES (:name, 1)
+ON CONFLICT (name) DO UPDATE SET version = version + 1
+""")
+
+
+def bump_data_version(connection, name=WATER_QUALITY_VERSION):
+    """在写入数据的事务中递增数据版本，使相关缓存失效"""
+    connection.execute(_BUMP_SQL, {'name': name})
+
+
+def current_data_version(name=WATER_QUALITY_VERSION):
+    row = db.session.get(DataVersion, name)
+    return row.version if row else 0
+
+
+def normalize_params(params):
+    """把请求参数规范化为可哈希、与顺序无关的键：去掉空值，时间统一为 ISO 格式"""
+    normalized = []
+    for name, value in params.items():
+        if value is None or value == '':
+            continue
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        normalized.append((name, value))
+    return tuple(sorted(normalized))
+
+
+class ResultCache:
+    """带 LRU 淘汰和内存上限的分析结果缓存
+
+    键为 (接口, 数据版本, 规范化参数)，数据版本变化后旧条目不再命中并逐渐被淘汰。
+    条目大小按结果 JSON 序列化后的长度估算。
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(endpoint, params, version):
+        return endpoint, version, normalize_params(params)
+
+    def get(self, key):
+        """返回 (是否命中, 值)，值本身可以是 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def set(self, key, value):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def get_or_compute(self, endpoint, params, compute):
+        """按当前数据版本查缓存，未命中时计算并写入；返回 (值, 是否命中)"""
+        key = self.make_key(endpoint, params, current_data_version())
+        hit, value = self.get(key)
+        if not hit:
+            value = compute()
+            self.set(key, value)
+        return value, hit
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
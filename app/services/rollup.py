@@ -0,0 +1,69 @@
+from sqlalchemy import text, func
+from ..models import NUMERIC_COLUMNS, WaterQualityRollup, db
+
+# 汇总粒度 -> 由 monitor_time 计算时间桶的 SQL 表达式
+GRANULARITIES = {
+    'day': "date(monitor_time)",
+    'hour': "strftime('%Y-%m-%d %H:00', monitor_time)",
+}
+
+_UPSERT_SQL = """
+INSERT INTO water_quality_rollup
+    (granularity, bucket, province, section_name, parameter,
+     value_count, value_sum, value_min, value_max, value_sum_sq)
+SELECT :granularity, {bucket}, coalesce(province, ''), coalesce(section_name, ''), :parameter,
+       count({col}), sum({col}), min({col}), max({col}), sum({col} * {col})
+FROM {table}
+WHERE id BETWEEN :first_id AND :last_id AND {col} IS NOT NULL
+GROUP BY 2, 3, 4
+ON CONFLICT (granularity, bucket, province, section_name, parameter) DO UPDATE SET
+    value_count = value_count + excluded.value_count,
+    value_sum = value_sum + excluded.value_sum,
+    value_min = min(value_min, excluded.value_min),
+    value_max = max(value_max, excluded.value_max),
+    value_sum_sq = value_sum_sq + excluded.value_sum_sq
+"""
+
+
+def update_rollups(connection, first_id, last_id, table='water_quality'):
+    """把 table 中 id 在 [first_id, last_id] 内的读数累加到日/小时汇总表"""
+    for granularity, bucket in GRANULARITIES.items():
+        for col in NUMERIC_COLUMNS:
+            connection.execute(
+                text(_UPSERT_SQL.format(table=f'"{table}"', bucket=bucket, col=f'"{col}"')),
+                {'granularity': granularity, 'parameter': col,
+                 'first_id': first_id, 'last_id': last_id}
+            )
+
+
+def bucket_bounds(start_date, end_date, granularity='day'):
+    """将时间范围换算为汇总表的时间桶范围 (包含起点, 包含终点)
+
+    终点恰好落在桶的起始时刻时（如次日零点）不包含该桶。
+    """
+    if granularity == 'hour':
+        start = start_date.strftime('%Y-%m-%d %H:00')
+        end = end_date.strftime('%Y-%m-%d %H:00')
+        on_boundary = end_date.minute == 0 and end_date.second == 0 and end_date.microsecond == 0
+    else:
+        start = start_date.strftime('%Y-%m-%d')
+        end = end_date.strftime('%Y-%m-%d')
+        on_boundary = end_date.time() == end_date.min.time()
+    return start, end, on_boundary
+
+
+def query_rollup_averages(parameters, start_date, end_date, granularity='day'):
+    """按时间桶返回各参数的平均值：[(bucket, parameter, avg), ...]，按时间排序"""
+    start, end, exclude_end = bucket_bounds(start_date, end_date, granularity)
+    R = WaterQualityRollup
+    query = db.session.query(
+        R.bucket,
+        R.parameter,
+        (func.sum(R.value_sum) / func.sum(R.value_count)).label('avg_value')
+    ).filter(
+        R.granularity == granularity,
+        R.parameter.in_(parameters),
+        R.bucket >= start,
+        R.bucket < end if exclude_end else R.bucket <= end
+    ).group_by(R.bucket, R.parameter).order_by(R.bucket)
+    return query.all()
@@ -0,0 +1,176 @@
+from datetime import datetime
+from sqlalchemy import text, func, select
+from ..models import NUMERIC_COLUMNS, ParameterStatistics, WaterQuality, db
+from .partitions import water_quality_source
+
+# 先在 SQL 中按组两遍计算本批数据的 (n, mean, M2)，再用 Chan 的并行公式与已有累加器合并
+_UPSERT_SQL = """
+WITH batch AS (
+    SELECT coalesce(province, '') AS p, coalesce(basin, '') AS b, coalesce(section_name, '') AS s,
+           strftime('%Y-%m', monitor_time) AS m, {col} AS x
+    FROM {table}
+    WHERE id BETWEEN :first_id AND :last_id AND {col} IS NOT NULL
+), groups AS (
+    SELECT p, b, s, m, count(x) AS n, avg(x) AS mean, min(x) AS mn, max(x) AS mx
+    FROM batch GROUP BY p, b, s, m
+)
+INSERT INTO parameter_statistics
+    (province, basin, section_name, month, parameter, value_count, mean, m2, value_min, value_max)
+SELECT g.p, g.b, g.s, g.m, :parameter, g.n, g.mean,
+       sum((batch.x - g.mean) * (batch.x - g.mean)), g.mn, g.mx
+FROM batch JOIN groups AS g ON batch.p = g.p AND batch.b = g.b AND batch.s = g.s AND batch.m = g.m
+WHERE true
+GROUP BY g.p, g.b, g.s, g.m
+ON CONFLICT (province, basin, section_name, month, parameter) DO UPDATE SET
+    value_count = value_count + excluded.value_count,
+    mean = mean + (excluded.mean - mean) * excluded.value_count / (value_count + excluded.value_count),
+    m2 = m2 + excluded.m2 + (excluded.mean - mean) * (excluded.mean - mean)
+         * value_count * excluded.value_count / (value_count + excluded.value_count),
+    value_min = min(value_min, excluded.value_min),
+    value_max = max(value_max, excluded.value_max)
+"""
+
+
+def update_running_statistics(connection, first_id, last_id, table='water_quality'):
+    """把 table 中 id 在 [first_id, last_id] 内的读数合并进各组的累加器"""
+    for col in NUMERIC_COLUMNS:
+        connection.execute(text(_UPSERT_SQL.format(table=f'"{table}"', col=f'"{col}"')),
+                           {'parameter': col, 'first_id': first_id, 'last_id': last_id})
+
+
+def merge(a, b):
+    """合并两个 (n, mean, M2, min, max) 累加器"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    n = a[0] + b[0]
+    delta = b[1] - a[1]
+    mean = a[1] + delta * b[0] / n
+    m2 = a[2] + b[2] + delta * delta * a[0] * b[0] / n
+    return n, mean, m2, min(a[3], b[3]), max(a[4], b[4])
+
+
+def _raw_conditions(start=None, end=None, end_inclusive=True, province=None, basin=None, section_name=None,
+                    source=WaterQuality):
+    conditions = []
+    if start:
+        conditions.append(source.monitor_time >= start)
+    if end:
+        conditions.append(source.monitor_time <= end if end_inclusive else source.monitor_time < end)
+    if province:
+        conditions.append(source.province == province)
+    if basin:
+        conditions.append(source.basin == basin)
+    if section_name:
+        conditions.append(source.section_name == section_name)
+    return conditions
+
+
+def raw_parameter_summary(parameters, conditions, source=WaterQuality):
+    """直接在原始读数上两遍聚合：{参数: (n, mean, M2, min, max)}"""
+    columns = [getattr(source, col) for col in parameters]
+    aggregates = []
+    for column in columns:
+        aggregates += [func.count(column), func.avg(column), func.min(column), func.max(column)]
+    first_pass = db.session.query(*aggregates).filter(*conditions).one()
+
+    partial = {}
+    for i, col in enumerate(parameters):
+        count, mean, min_val, max_val = first_pass[i * 4: i * 4 + 4]
+        if count:
+            partial[col] = (count, mean, min_val, max_val)
+    if not partial:
+        return {}
+
+    deviations = [func.sum((getattr(source, col) - mean) * (getattr(source, col) - mean))
+                  for col, (_, mean, _, _) in partial.items()]
+    m2_values = db.session.query(*deviations).filter(*conditions).one()
+    return {col: (count, mean, m2, min_val, max_val)
+            for (col, (count, mean, min_val, max_val)), m2 in zip(partial.items(), m2_values)}
+
+
+def stored_parameter_summary(parameters, month_from=None, month_to=None,
+                             province=None, basin=None, section_name=None):
+    """在累加器表中合并所选月份和分组：{参数: (n, mean, M2, min, max)}"""
+    S = ParameterStatistics
+    conditions = [S.parameter.in_(parameters)]
+    if month_from:
+        conditions.append(S.month >= month_from)
+    if month_to:
+        conditions.append(S.month <= month_to)
+    if province:
+        conditions.append(S.province == province)
+    if basin:
+        conditions.append(S.basin == basin)
+    if section_name:
+        conditions.append(S.section_name == section_name)
+
+    selected = select(S.parameter, S.value_count.label('n'), S.mean, S.m2,
+                      S.value_min, S.value_max).where(*conditions).cte('selected')
+    totals = select(
+        selected.c.parameter,
+        func.sum(selected.c.n).label('n'),
+        (func.sum(selected.c.n * selected.c.mean) / func.sum(selected.c.n)).label('mean'),
+        func.min(selected.c.value_min).label('value_min'),
+        func.max(selected.c.value_max).label('value_max')
+    ).group_by(selected.c.parameter).cte('totals')
+    deviation = selected.c.mean - totals.c.mean
+    query = select(
+        totals.c.parameter, totals.c.n, totals.c.mean,
+        func.sum(selected.c.m2 + selected.c.n * deviation * deviation),
+        totals.c.value_min, totals.c.value_max
+    ).join_from(selected, totals, selected.c.parameter == totals.c.parameter).group_by(
+        totals.c.parameter, totals.c.n, totals.c.mean, totals.c.value_min, totals.c.value_max)
+
+    return {row[0]: tuple(row[1:]) for row in db.session.execute(query) if row[1]}
+
+
+def _month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _shift_month(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def summarize(parameters, start_date=None, end_date=None, province=None, basin=None, section_name=None):
+    """任意筛选组合下各参数的 (n, mean, M2, min, max)
+
+    完整月份直接合并累加器；起止时间所在的不完整月份只扫描这一小段原始读数后再合并。
+    累加器表尚未回填时退化为全部扫描原始读数。
+    """
+    filters = dict(province=province, basin=basin, section_name=section_name)
+
+    def raw(start, end, end_inclusive=True):
+        source = water_quality_source(start, end)
+        return raw_parameter_summary(parameters, _raw_conditions(start, end, end_inclusive, source=source, **filters),
+                                     source)
+
+    if db.session.query(ParameterStatistics.id).first() is None:
+        return raw(start_date, end_date)
+
+    if start_date and end_date and _month_start(start_date) == _month_start(end_date):
+        return raw(start_date, end_date)
+
+    parts = []
+    month_from = month_to = None
+    if start_date:
+        if start_date == _month_start(start_date):
+            month_from = start_date.strftime('%Y-%m')
+        else:
+            next_month = _shift_month(start_date, 1)
+            month_from = next_month.strftime('%Y-%m')
+            parts.append(raw(start_date, next_month, end_inclusive=False))
+    if end_date:
+        month_to = _shift_month(end_date, -1).strftime('%Y-%m')
+        parts.append(raw(_month_start(end_date), end_date))
+    if month_from is None or month_to is None or month_from <= month_to:
+        parts.append(stored_parameter_summary(parameters, month_from, month_to, **filters))
+
+    summary = {}
+    for part in parts:
+        for col, accumulator in part.items():
+            summary[col] = merge(summary.get(col), accumulator)
+    return summary
@@ -0,0 +1,42 @@
+from sqlalchemy import text
+from ..models import NUMERIC_COLUMNS, StationLatest
+
+# 与 WaterQuality 同名、需要随最新读数保存的字段
+READING_COLUMNS = ['basin', 'monitor_time', 'quality_level'] + NUMERIC_COLUMNS + ['station_status']
+
+_COLUMN_LIST = ', '.join(f'"{col}"' for col in READING_COLUMNS)
+
+# 先取本批数据中每个断面最新的一条，再只在它比已保存的读数更新时覆盖
+_UPSERT_SQL = f"""
+INSERT INTO station_latest (province, section_name, reading_id, {_COLUMN_LIST})
+SELECT province, section_name, reading_id, {_COLUMN_LIST}
+FROM (
+    SELECT coalesce(province, '') AS province, coalesce(section_name, '') AS section_name,
+           id AS reading_id, {_COLUMN_LIST},
+           row_number() OVER (PARTITION BY coalesce(province, ''), coalesce(section_name, '')
+                              ORDER BY monitor_time DESC, id DESC) AS rank
+    FROM {{table}}
+    WHERE id BETWEEN :first_id AND :last_id
+)
+WHERE rank = 1
+ON CONFLICT (province, section_name) DO UPDATE SET
+    reading_id = excluded.reading_id,
+    {', '.join(f'"{col}" = excluded."{col}"' for col in READING_COLUMNS)}
+WHERE excluded.monitor_time > station_latest.monitor_time
+   OR (excluded.monitor_time = station_latest.monitor_time AND excluded.reading_id > station_latest.reading_id)
+"""
+
+
+def update_station_latest(connection, first_id, last_id, table='water_quality'):
+    """用 table 中 id 在 [first_id, last_id] 内的读数更新各断面的最新状态"""
+    connection.execute(text(_UPSERT_SQL.format(table=f'"{table}"')), {'first_id': first_id, 'last_id': last_id})
+
+
+def latest_readings(province=None, basin=None):
+    """返回各断面的最新读数，按省份、断面排序"""
+    query = StationLatest.query
+    if province:
+        query = query.filter(StationLatest.province == province)
+    if basin:
+        query = query.filter(StationLatest.basin == basin)
+    return query.order_by(StationLatest.province, StationLatest.section_name).all()
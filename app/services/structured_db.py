@@ -0,0 +1,78 @@
+import os
+import queue
+import sqlite3
+from pathlib import Path
+from flask import g
+
+DEFAULT_DB_PATH = os.path.join('instance', 'water_quality_structured.db')
+
+
+class StructuredDB:
+    """结构化水质数据库的只读连接池
+
+    每个应用上下文从池中借出一个连接，上下文结束时归还；连接长期复用，
+    因此 sqlite3 的预编译语句缓存可以跨请求命中。
+    """
+
+    def __init__(self, pool_size=8, cached_statements=256):
+        self.db_path = DEFAULT_DB_PATH
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def init_app(self, app):
+        self.db_path = app.config.setdefault('STRUCTURED_DB_PATH', DEFAULT_DB_PATH)
+        self.pool_size = app.config.setdefault('STRUCTURED_DB_POOL_SIZE', self.pool_size)
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        app.teardown_appcontext(self.release)
+
+    def _connect(self):
+        # as_uri() 会转义路径中的 ?、#、% 并把 Windows 盘符路径转换为 file:///C:/... 形式
+        uri = Path(os.path.abspath(self.db_path)).as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def get(self):
+        """获取当前应用上下文的只读连接"""
+        if 'structured_db' not in g:
+            try:
+                g.structured_db = self._pool.get_nowait()
+            except queue.Empty:
+                g.structured_db = self._connect()
+        return g.structured_db
+
+    def release(self, exception=None):
+        """应用上下文结束时归还连接，池已满则直接关闭"""
+        conn = g.pop('structured_db', None)
+        if conn is None:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def data_version(self):
+        """库文件及其 WAL 文件的修改时间和大小，import_waterdata.py 写入新数据后随之变化"""
+        version = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            version.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    def close_all(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+structured_db = StructuredDB()
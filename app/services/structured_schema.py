@@ -0,0 +1,60 @@
+"""结构化水质数据库（instance/water_quality_structured.db）的字段定义
+
+import_waterdata.py 建表、导入时按此处声明的类型转换数据；
+未声明的列在导入时根据数据自动推断为 REAL 或 TEXT。
+"""
+
+PROVINCE_COLUMN = '省份'
+BASIN_COLUMN = '流域'
+SECTION_COLUMN = '断面名称'
+TIME_COLUMN = '监测时间'
+
+# 列名 -> SQLite 类型，顺序即建表顺序
+STRUCTURED_SCHEMA = {
+    PROVINCE_COLUMN: 'TEXT',
+    BASIN_COLUMN: 'TEXT',
+    SECTION_COLUMN: 'TEXT',
+    TIME_COLUMN: 'DATETIME',
+    '水质类别': 'TEXT',
+    '水温(℃)': 'REAL',
+    'pH(无量纲)': 'REAL',
+    '溶解氧(mg/L)': 'REAL',
+    '电导率(μS/cm)': 'REAL',
+    '浊度(NTU)': 'REAL',
+    '高锰酸盐指数(mg/L)': 'REAL',
+    '氨氮(mg/L)': 'REAL',
+    '总磷(mg/L)': 'REAL',
+    '总氮(mg/L)': 'REAL',
+    '叶绿素α(mg/L)': 'REAL',
+    '藻密度(cells/L)': 'REAL',
+    '站点情况': 'TEXT',
+}
+
+# 结构化库列名 -> WaterQuality 字段名；迁移到带类型的主库，以及主库按原列名对外提供数据时使用
+TYPED_COLUMN_MAP = {
+    PROVINCE_COLUMN: 'province',
+    BASIN_COLUMN: 'basin',
+    SECTION_COLUMN: 'section_name',
+    TIME_COLUMN: 'monitor_time',
+    '水质类别': 'quality_level',
+    '水温(℃)': 'temperature',
+    'pH(无量纲)': 'pH',
+    '溶解氧(mg/L)': 'dissolved_oxygen',
+    '电导率(μS/cm)': 'conductivity',
+    '浊度(NTU)': 'turbidity',
+    '高锰酸盐指数(mg/L)': 'permanganate_index',
+    '氨氮(mg/L)': 'ammonia_nitrogen',
+    '总磷(mg/L)': 'total_phosphorus',
+    '总氮(mg/L)': 'total_nitrogen',
+    '叶绿素α(mg/L)': 'chlorophyll_a',
+    '藻密度(cells/L)': 'algae_density',
+    '站点情况': 'station_status',
+}
+
+# 时间统一存为可排序的 ISO 格式文本
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def quote_identifier(name):
+    """为 SQLite 标识符加双引号"""
+    return '"' + str(name).replace('"', '""') + '"'
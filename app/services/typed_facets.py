@@ -0,0 +1,49 @@
+from sqlalchemy import DateTime, bindparam, text
+from ..models import WaterQualityFacet, db
+
+_UPSERT_SQL = """
+INSERT INTO water_quality_facet (province, basin, section_name, row_count, first_time, last_time)
+SELECT coalesce(province, ''), coalesce(basin, ''), coalesce(section_name, ''),
+       count(*), min(monitor_time), max(monitor_time)
+FROM {table}
+WHERE {where}
+GROUP BY 1, 2, 3
+ON CONFLICT (province, basin, section_name) DO UPDATE SET
+    row_count = row_count + excluded.row_count,
+    first_time = min(first_time, excluded.first_time),
+    last_time = max(last_time, excluded.last_time)
+"""
+
+
+def update_typed_facets(connection, first_id, last_id, table='water_quality'):
+    """把 table 中 id 在 [first_id, last_id] 内的读数计入主库的筛选项字典"""
+    connection.execute(text(_UPSERT_SQL.format(table=f'"{table}"', where='id BETWEEN :first_id AND :last_id')),
+                       {'first_id': first_id, 'last_id': last_id})
+
+
+def trim_typed_facets(connection, month, tables):
+    """删除 month 之前的读数后修正筛选项字典
+
+    最晚时间早于 month 的组合已没有读数，直接删除；跨越 month 的组合从剩余的 tables
+    （热表和未删除的分区）重新计数。
+    """
+    month = bindparam('month', month, type_=DateTime())
+    connection.execute(text("DELETE FROM water_quality_facet WHERE last_time < :month").bindparams(month))
+    connection.execute(text("CREATE TEMP TABLE facet_recount AS SELECT province, basin, section_name "
+                            "FROM water_quality_facet WHERE first_time < :month").bindparams(month))
+    connection.execute(text("DELETE FROM water_quality_facet WHERE first_time < :month").bindparams(month))
+    where = ("(coalesce(province, ''), coalesce(basin, ''), coalesce(section_name, '')) IN "
+             "(SELECT province, basin, section_name FROM facet_recount)")
+    for table in tables:
+        connection.execute(text(_UPSERT_SQL.format(table=f'"{table}"', where=where)))
+    connection.execute(text("DROP TABLE temp.facet_recount"))
+
+
+def facet_rows(province=None):
+    """返回 (省份, 流域, 断面, 行数, 最早时间, 最晚时间) 列表，空字符串还原为 None"""
+    F = WaterQualityFacet
+    query = db.session.query(F.province, F.basin, F.section_name, F.row_count, F.first_time, F.last_time)
+    if province:
+        query = query.filter(F.province == province)
+    return [(p or None, b or None, s or None, n, first, last)
+            for p, b, s, n, first, last in query.order_by(F.province, F.basin, F.section_name)]
@@ -0,0 +1,122 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import insert, func
+from ..models import RanchLocation, WeatherData, db
+from .weather_service import WeatherService
+
+
+def to_weather_row(location_id, payload, timestamp):
+    """把 open-meteo 当前天气数据转换为 WeatherData 的一行"""
+    current = payload.get('current', {})
+    visibility = current.get('visibility')
+    return {
+        'location_id': location_id,
+        'timestamp': timestamp,
+        'temperature': current.get('temperature_2m'),
+        'humidity': current.get('relative_humidity_2m'),
+        'precipitation': current.get('precipitation'),
+        'wind_speed': current.get('wind_speed_10m'),
+        'wind_direction': current.get('wind_direction_10m'),
+        'pressure': current.get('pressure_msl'),
+        'cloud_cover': current.get('cloud_cover'),
+        'visibility': visibility / 1000 if visibility is not None else None,  # 接口单位为米
+        'weather_code': current.get('weather_code'),
+        'uv_index': current.get('uv_index')
+    }
+
+
+def observation_time(payload):
+    """open-meteo 当前天气的观测时间（UTC），接口返回的是当地时间和 utc_offset_seconds"""
+    current = payload.get('current') or {}
+    if not current.get('time'):
+        return None
+    local = datetime.strptime(current['time'], '%Y-%m-%dT%H:%M')
+    return local - timedelta(seconds=payload.get('utc_offset_seconds', 0))
+
+
+def latest_weather_by_location(location_ids=None):
+    """返回每个位置最新的一条 WeatherData：{位置id: WeatherData}"""
+    latest = db.session.query(
+        WeatherData.location_id,
+        func.max(WeatherData.timestamp).label('timestamp')
+    ).group_by(WeatherData.location_id)
+    if location_ids is not None:
+        latest = latest.filter(WeatherData.location_id.in_(location_ids))
+    latest = latest.subquery()
+
+    rows = WeatherData.query.join(
+        latest,
+        (WeatherData.location_id == latest.c.location_id) & (WeatherData.timestamp == latest.c.timestamp)
+    ).all()
+    return {row.location_id: row for row in rows}
+
+
+class WeatherIngestScheduler:
+    """后台定时采集所有牧场位置的天气，批量写入 WeatherData
+
+    由 WEATHER_INGEST_ENABLED 开启，采集间隔为 WEATHER_INGEST_INTERVAL 秒。
+    线程在应用处理第一个请求时启动，避免在开发服务器的重载监控进程中重复运行。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.interval = 600
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.setdefault('WEATHER_INGEST_INTERVAL', 600)
+        # 本地数据超过该时长视为过期，接口改为实时获取；
+        # 记录的是上游观测时间，本身比采集时刻晚最多一个观测周期（open-meteo 为 15 分钟）
+        app.config.setdefault('WEATHER_STORE_MAX_AGE', self.interval * 2 + 900)
+        if app.config.setdefault('WEATHER_INGEST_ENABLED', False):
+            app.before_request(self.start)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='weather-ingest', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"天气数据采集失败: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """采集一次所有位置的当前天气，返回写入的行数
+
+        绕过缓存向上游取最新数据，以观测时间作为 timestamp；
+        观测时间不晚于该位置已存最新记录的（上游尚未更新）不重复写入。
+        """
+        with self.app.app_context():
+            locations = RanchLocation.query.all()
+            if not locations:
+                return 0
+            payloads = WeatherService.get_locations_current(locations, fresh=True)
+            stored = latest_weather_by_location([location.id for location in locations])
+            rows = []
+            for location_id, payload in payloads.items():
+                timestamp = observation_time(payload) if payload else None
+                if timestamp is None:
+                    continue
+                if location_id in stored and timestamp <= stored[location_id].timestamp:
+                    continue
+                rows.append(to_weather_row(location_id, payload, timestamp))
+            if rows:
+                db.session.execute(insert(WeatherData), rows)
+                db.session.commit()
+            return len(rows)
+
+
+weather_ingest = WeatherIngestScheduler()
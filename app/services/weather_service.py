@@ -1,5 +1,91 @@
 import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+class _Flight:
+    """一次进行中的上游请求，并发的同键请求等待它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+class WeatherCache:
+    """带过期时间的天气数据缓存
+
+    - 新鲜期内直接返回缓存；
+    - 过期但仍在 stale_ttl 内时立即返回旧数据，并在后台刷新（stale-while-revalidate）；
+    - 同一个键的并发未命中只发起一次上游请求（single-flight）；
+    - 上游失败或超时时返回最后一次成功的数据。
+    """
+
+    def __init__(self, stale_ttl=24 * 3600):
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl, fetch):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry:
+            payload, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < ttl:
+                return payload
+            if age < self.stale_ttl:
+                self._refresh_in_background(key, fetch)
+                return payload
+
+        result = self._fetch_once(key, fetch)
+        if result is None and entry:
+            return entry[0]
+        return result
+
+    def _fetch_once(self, key, fetch):
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            return flight.result
+
+        try:
+            flight.result = fetch()
+            if flight.result is not None:
+                with self._lock:
+                    self._entries[key] = (flight.result, time.monotonic())
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+        return flight.result
+
+    def peek(self, key, max_age):
+        """返回不超过 max_age 秒的缓存数据，没有则返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[1] < max_age:
+            return entry[0]
+        return None
+
+    def put(self, key, payload):
+        with self._lock:
+            self._entries[key] = (payload, time.monotonic())
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._inflight:
+                return
+        threading.Thread(target=self._fetch_once, args=(key, fetch), daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
 class WeatherService:
     """简单的天气服务类"""
@@ -10,48 +96,150 @@ class WeatherService:
     DEFAULT_LATITUDE = 39.9042
     DEFAULT_LONGITUDE = 116.4074
     
+    CURRENT_FIELDS = ["temperature_2m", "relative_humidity_2m", "precipitation", 
+                      "wind_speed_10m", "wind_direction_10m", "weather_code",
+                      "pressure_msl", "surface_pressure", "cloud_cover", 
+                      "uv_index", "visibility", "is_day"]
+    DAILY_FIELDS = ["temperature_2m_max", "temperature_2m_min", "precipitation_sum", 
+                    "weather_code"]
+    
+    # 缓存有效期（秒）和上游请求超时
+    CURRENT_TTL = 300
+    FORECAST_TTL = 1800
+    REQUEST_TIMEOUT = 5
+    
+    # 多地点查询：每个上游请求合并的坐标数和并发请求数
+    BATCH_SIZE = 50
+    MAX_WORKERS = 8
+    
+    cache = WeatherCache()
+    
+    # 复用连接的 HTTP 会话
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS * 2))
+    session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS * 2))
+    
     @staticmethod
-    def get_current_weather():
-        """获取当前天气数据 - 使用固定位置"""
-        params = {
-            "latitude": WeatherService.DEFAULT_LATITUDE,
-            "longitude": WeatherService.DEFAULT_LONGITUDE,
-            "current": ["temperature_2m", "relative_humidity_2m", "precipitation", 
-                        "wind_speed_10m", "wind_direction_10m", "weather_code",
-                        "pressure_msl", "surface_pressure", "cloud_cover", 
-                        "uv_index", "visibility", "is_day"],
-            "timezone": "auto"
-        }
-        
+    def _fetch(params, error_message):
         try:
-            response = requests.get(WeatherService.BASE_URL, params=params)
+            response = WeatherService.session.get(WeatherService.BASE_URL, params=params,
+                                                  timeout=WeatherService.REQUEST_TIMEOUT)
             response.raise_for_status()
             return response.json()
             
         except Exception as e:
-            print(f"获取天气数据失败: {str(e)}")
+            print(f"{error_message}: {str(e)}")
             return None
     
     @staticmethod
-    def get_weather_forecast(days=7):
-        """获取天气预报 - 使用固定位置"""
-        params = {
-            "latitude": WeatherService.DEFAULT_LATITUDE,
-            "longitude": WeatherService.DEFAULT_LONGITUDE,
-            "daily": ["temperature_2m_max", "temperature_2m_min", "precipitation_sum", 
-                     "weather_code"],
+    def _current_params(latitude, longitude):
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "current": WeatherService.CURRENT_FIELDS,
+            "timezone": "auto"
+        }
+    
+    @staticmethod
+    def _forecast_params(latitude, longitude, days):
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "daily": WeatherService.DAILY_FIELDS,
             "timezone": "auto",
             "forecast_days": days
         }
+    
+    @staticmethod
+    def _coordinates(latitude, longitude):
+        """未传入的坐标使用默认位置；0.0 是合法坐标（赤道/本初子午线），不能按假值处理"""
+        return (WeatherService.DEFAULT_LATITUDE if latitude is None else latitude,
+                WeatherService.DEFAULT_LONGITUDE if longitude is None else longitude)
+    
+    @staticmethod
+    def get_current_weather(latitude=None, longitude=None):
+        """获取当前天气数据 - 默认使用固定位置"""
+        params = WeatherService._current_params(*WeatherService._coordinates(latitude, longitude))
         
-        try:
-            response = requests.get(WeatherService.BASE_URL, params=params)
-            response.raise_for_status()
-            return response.json()
-            
-        except Exception as e:
-            print(f"获取天气预报失败: {str(e)}")
-            return None
+        key = ('current', params['latitude'], params['longitude'])
+        return WeatherService.cache.get(key, WeatherService.CURRENT_TTL,
+                                        lambda: WeatherService._fetch(params, "获取天气数据失败"))
+    
+    @staticmethod
+    def get_weather_forecast(days=7, latitude=None, longitude=None):
+        """获取天气预报 - 默认使用固定位置"""
+        params = WeatherService._forecast_params(*WeatherService._coordinates(latitude, longitude), days)
+        
+        key = ('forecast', params['latitude'], params['longitude'], days)
+        return WeatherService.cache.get(key, WeatherService.FORECAST_TTL,
+                                        lambda: WeatherService._fetch(params, "获取天气预报失败"))
+    
+    @staticmethod
+    def get_locations_current(locations, fresh=False):
+        """并发获取多个牧场位置的当前天气，返回 {位置id: 天气数据或None}
+
+        fresh=True 时跳过缓存、失败时也不退回旧数据，供定时采集入库使用。
+        """
+        return WeatherService._get_for_locations(
+            locations, 'current', (), WeatherService.CURRENT_TTL,
+            lambda lat, lon: WeatherService._current_params(lat, lon), fresh)
+    
+    @staticmethod
+    def get_locations_forecast(locations, days=7):
+        """并发获取多个牧场位置的天气预报，返回 {位置id: 预报数据或None}"""
+        return WeatherService._get_for_locations(
+            locations, 'forecast', (days,), WeatherService.FORECAST_TTL,
+            lambda lat, lon: WeatherService._forecast_params(lat, lon, days))
+    
+    @staticmethod
+    def _get_for_locations(locations, kind, key_suffix, ttl, make_params, fresh=False):
+        """多地点查询：先查缓存，未命中的位置按批合并坐标发起请求，各批并发执行
+
+        open-meteo 支持以逗号分隔传入多组坐标并按顺序返回列表；
+        某一批失败时退化为逐个位置单独请求（各自受 REQUEST_TIMEOUT 约束），
+        仍失败的位置使用最后一次成功的缓存数据。
+        fresh=True 时所有位置都向上游请求，失败的位置返回 None。
+        """
+        cache = WeatherService.cache
+        results = {}
+        missing = []
+        for location in locations:
+            key = (kind, location.latitude, location.longitude) + key_suffix
+            payload = None if fresh else cache.peek(key, ttl)
+            if payload is not None:
+                results[location.id] = payload
+            else:
+                missing.append((location, key))
+        
+        def fetch_single(item):
+            location, _ = item
+            return WeatherService._fetch(make_params(location.latitude, location.longitude),
+                                         f"获取位置 {location.id} 的天气数据失败")
+        
+        def fetch_batch(batch):
+            params = make_params(','.join(str(loc.latitude) for loc, _ in batch),
+                                 ','.join(str(loc.longitude) for loc, _ in batch))
+            data = WeatherService._fetch(params, "批量获取天气数据失败")
+            if isinstance(data, dict) and len(batch) == 1:
+                data = [data]
+            if isinstance(data, list) and len(data) == len(batch):
+                return data
+            with ThreadPoolExecutor(max_workers=WeatherService.MAX_WORKERS) as executor:
+                return list(executor.map(fetch_single, batch))
+        
+        batches = [missing[i:i + WeatherService.BATCH_SIZE]
+                   for i in range(0, len(missing), WeatherService.BATCH_SIZE)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(len(batches), WeatherService.MAX_WORKERS)) as executor:
+                for batch, payloads in zip(batches, executor.map(fetch_batch, batches)):
+                    for (location, key), payload in zip(batch, payloads):
+                        if payload is not None:
+                            cache.put(key, payload)
+                        elif not fresh:
+                            payload = cache.peek(key, cache.stale_ttl)
+                        results[location.id] = payload
+        
+        return results
     
     @staticmethod
     def get_weather_code_description(code):
@@ -0,0 +1,46 @@
+"""启动耗时基准：在全新的子进程中测量 import app + create_app() 的耗时
+
+每次都启动新的解释器，避免模块缓存影响结果；同时报告启动后已加载的重型依赖，
+用于确认数据分析依赖仍是按需加载。
+
+用法：python bench_startup.py [--runs 5] [--warmup]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['pandas', 'numpy', 'plotly', 'sklearn', 'openpyxl', 'pyarrow']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app({config})
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {modules!r} if m in sys.modules]}}))
+"""
+
+
+def measure(config):
+    code = PROBE.format(config=repr(config), modules=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs, config):
+    results = [measure(config) for _ in range(runs)]
+    timings = [r['elapsed'] for r in results]
+    print(f"create_app() {runs} 次  中位数 {statistics.median(timings) * 1000:8.1f}ms  "
+          f"最快 {min(timings) * 1000:8.1f}ms  最慢 {max(timings) * 1000:8.1f}ms")
+    print(f"启动后已加载的重型依赖: {', '.join(results[-1]['loaded']) or '无'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='应用启动耗时基准')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', action='store_true', help='开启 ANALYSIS_WARMUP 后测量')
+    args = parser.parse_args()
+
+    run(args.runs, {'ANALYSIS_WARMUP': True} if args.warmup else {})
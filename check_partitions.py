@@ -0,0 +1,157 @@
+"""分区删除一致性检查
+
+在临时数据库上模拟旧库升级、封存和按月删除，检查：
+- 旧库的 water_quality 升级为 AUTOINCREMENT 后数据不变，sqlite_sequence 不低于已有的最大 id；
+- drop_before() 之后热表和分区中没有早于删除月份的读数，新写入的读数不会复用已删除的 id；
+- 汇总表、参数累加器、断面最新状态和筛选项字典与根据剩余原始读数重建的结果完全一致，
+  统计接口的记录数和各参数计数与原始读数一致。
+任何一项不通过都以非零状态退出。
+
+用法：python check_partitions.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, text
+from sqlalchemy.schema import CreateTable
+
+from app import create_app, db
+from app.models import NUMERIC_COLUMNS, User, WaterQuality
+from app.migrations import upgrade_database
+from app.services.ingestion import DERIVED_TABLES, WaterQualityIngestor, rebuild_derived
+from app.services.partitions import list_partitions, partition_manager
+
+
+def make_frame(n_rows, start, days, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'monitor_time': [start + timedelta(minutes=int(m)) for m in rng.integers(0, days * 24 * 60, n_rows)],
+        'province': rng.choice(['山东省', '浙江省', '广东省'], n_rows),
+        'basin': rng.choice(['黄河流域', '长江流域'], n_rows),
+        'section_name': rng.choice([f'断面{i}' for i in range(12)], n_rows),
+        'quality_level': rng.choice(['I', 'II', 'III'], n_rows),
+    })
+    for col in NUMERIC_COLUMNS:
+        values = rng.normal(10, 2, n_rows)
+        values[rng.random(n_rows) < 0.1] = np.nan
+        df[col] = values
+    return df
+
+
+def ingest(df):
+    with db.engine.begin() as conn:
+        WaterQualityIngestor().ingest(df, conn)
+
+
+def snapshot():
+    """各派生表的全部行（去掉自增主键，浮点数按精度取整）"""
+    with db.engine.connect() as conn:
+        return {table: sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in row[1:])
+                              for row in conn.execute(text(f"SELECT * FROM {table}")))
+                for table in DERIVED_TABLES}
+
+
+def raw_tables(conn):
+    return [WaterQuality.__table__] + [table for _, table in list_partitions(conn)]
+
+
+def main():
+    results = []
+
+    def check(label, ok):
+        results.append(ok)
+        print(f"[{'OK' if ok else '失败'}] {label}")
+
+    now = datetime.now()
+    this_month = datetime(now.year, now.month, 1)
+    cutoff = (this_month - timedelta(days=1)).replace(day=1)
+    history_start = cutoff - timedelta(days=100)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'partitions.db')}",
+                          'TESTING': True})
+        with app.app_context():
+            # 模拟旧库：water_quality 没有 AUTOINCREMENT，且已有读数和分区
+            db.create_all()
+            source = WaterQuality.__table__
+            with db.engine.begin() as conn:
+                source.drop(conn)
+                conn.exec_driver_sql(str(CreateTable(source).compile(conn)).replace(' AUTOINCREMENT', ''))
+            ingest(make_frame(4000, history_start, (now - history_start).days, seed=1))
+            with db.engine.begin() as conn:
+                partition_manager.seal(conn)
+            # 封存后热表只剩本月读数；补录两条早于删除月份的旧读数，其中一条是最大 id
+            ingest(make_frame(2, history_start, 5, seed=2))
+            with db.engine.connect() as conn:
+                before_ids = {table.name: conn.execute(select(func.count(), func.max(table.c.id))).one()
+                              for table in raw_tables(conn)}
+
+            upgrade_database(db.engine)
+            user = User(username='partition_checker')
+            user.set_password('partition_checker')
+            db.session.add(user)
+            db.session.commit()
+
+            with db.engine.connect() as conn:
+                ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'water_quality'")).scalar()
+                after_ids = {table.name: conn.execute(select(func.count(), func.max(table.c.id))).one()
+                             for table in raw_tables(conn)}
+                seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'water_quality'")).scalar()
+            high_water = max(max_id or 0 for _, max_id in before_ids.values())
+            check('旧库升级为 AUTOINCREMENT', 'AUTOINCREMENT' in ddl.upper())
+            check('升级前后各表行数和最大 id 不变', before_ids == after_ids)
+            check('sqlite_sequence 不低于已有的最大 id', seq is not None and seq >= high_water)
+
+            with db.engine.begin() as conn:
+                dropped = partition_manager.drop_before(conn, cutoff)
+            check(f'删除了 {cutoff:%Y-%m} 之前的分区 {dropped}', bool(dropped))
+
+            with db.engine.connect() as conn:
+                stale = sum(conn.execute(select(func.count()).where(table.c.monitor_time < cutoff)).scalar()
+                            for table in raw_tables(conn))
+                old_partitions = [table.name for month, table in list_partitions(conn) if month < cutoff]
+            check('没有早于删除月份的读数或分区', stale == 0 and not old_partitions)
+
+            ingest(make_frame(1, this_month, 1, seed=3))
+            new_id = db.session.execute(select(func.max(WaterQuality.id))).scalar()
+            check('新读数不复用已删除的 id', new_id > high_water)
+
+            incremental = snapshot()
+            with db.engine.begin() as conn:
+                rebuild_derived(conn)
+            rebuilt = snapshot()
+            for table in DERIVED_TABLES:
+                check(f'{table} 与按剩余读数重建的结果一致', incremental[table] == rebuilt[table])
+
+            with db.engine.connect() as conn:
+                raw_total = sum(conn.execute(select(func.count()).select_from(table)).scalar()
+                                for table in raw_tables(conn))
+                raw_counts = {col: sum(conn.execute(select(func.count(table.c[col]))).scalar()
+                                       for table in raw_tables(conn))
+                              for col in NUMERIC_COLUMNS}
+                rollup_counts = dict(conn.execute(text(
+                    "SELECT parameter, sum(value_count) FROM water_quality_rollup "
+                    "WHERE granularity = 'day' GROUP BY parameter")).all())
+            check('日汇总的各参数计数与原始读数一致', rollup_counts == raw_counts)
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'partition_checker', 'password': 'partition_checker'})
+        data = client.get('/api/data/statistics').get_json()['data']
+        check('统计接口的记录数与原始读数一致', data['total_records'] == raw_total)
+        check('统计接口的各参数计数与原始读数一致',
+              {col: stats['count'] for col, stats in data['parameter_statistics'].items()} == raw_counts)
+
+        with app.app_context():
+            db.engine.dispose()
+
+    failures = results.count(False)
+    print(f"共 {len(results)} 项检查，{failures} 项未通过")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
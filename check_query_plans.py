@@ -0,0 +1,137 @@
+"""查询计划回归检查
+
+在临时数据库上调用各个接口，记录它们对 water_quality 相关表发出的每条查询，
+逐条执行 EXPLAIN QUERY PLAN；只要有查询退化为全表扫描就以非零状态退出。
+接口先在只有热表时调用一遍，封存历史月份后再调用一遍，覆盖跨分区查询。
+
+用法：python check_query_plans.py [-v]
+"""
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User
+from app.migrations import upgrade_database
+from app.services.ingestion import NUMERIC_COLUMNS, WaterQualityIngestor
+from app.services.partitions import PARTITION_NAME, partition_manager
+from app.services.result_cache import bump_data_version
+
+WATCHED_TABLES = ('water_quality', 'water_quality_rollup', 'parameter_statistics', 'station_latest')
+FULL_SCAN = re.compile(r'^SCAN (\w+)\b(?! USING)')
+
+START = (datetime.utcnow() - timedelta(days=20)).strftime('%Y-%m-%d')
+END = datetime.utcnow().strftime('%Y-%m-%d')
+
+# (说明, 方法, 路径, 请求体)
+ENDPOINTS = [
+    ('统计', 'GET', f'/api/data/statistics?province=山东省&start_date={START}&end_date={END}', None),
+    ('统计-按省份', 'GET', '/api/data/statistics?province=山东省', None),
+    ('相关性', 'GET', f'/api/data/correlation?start_date={START}&end_date={END}', None),
+    ('趋势', 'GET', f'/api/data/trend?parameter=pH&province=山东省&start_date={START}&end_date={END}', None),
+    ('聚类', 'GET', '/api/data/clustering', None),
+    ('报告', 'GET', f'/api/data/report?start_date={START}&end_date={END}', None),
+    ('导出', 'GET', f'/api/data/export?province=山东省&start_date={START}&end_date={END}', None),
+    ('历史', 'GET', f'/api/water_quality_history?dataType=ph&startDate={START}&endDate={END}', None),
+    ('断面最新', 'GET', '/api/water_quality/latest?province=山东省', None),
+    ('问答', 'POST', '/api/doubao-chat', {'question': '最近水质和pH怎么样', 'api_key': 'x'}),
+]
+
+
+def seed(app, n_rows=5000):
+    rng = np.random.default_rng(0)
+    now = datetime.utcnow()
+    df = pd.DataFrame({
+        'monitor_time': [now - timedelta(minutes=int(m)) for m in rng.integers(0, 60 * 24 * 60, n_rows)],
+        'province': rng.choice(['山东省', '浙江省', '广东省', '福建省'], n_rows),
+        'basin': rng.choice(['黄河流域', '长江流域', '珠江流域'], n_rows),
+        'section_name': rng.choice([f'断面{i}' for i in range(40)], n_rows),
+        'quality_level': rng.choice(['I', 'II', 'III'], n_rows),
+    })
+    for col in NUMERIC_COLUMNS:
+        df[col] = rng.normal(10, 2, n_rows)
+
+    with app.app_context():
+        db.create_all()
+        upgrade_database(db.engine)
+        user = User(username='plan_checker')
+        user.set_password('plan_checker')
+        db.session.add(user)
+        db.session.commit()
+        with db.engine.begin() as conn:
+            WaterQualityIngestor().ingest(df, conn)
+            conn.exec_driver_sql("ANALYZE")
+
+
+def capture_queries(app, suffix=''):
+    """调用所有接口，返回 [(说明, SQL, 参数)]"""
+    captured = []
+    current = {'label': None}
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sql = statement.lstrip().upper()
+        if executemany or not (sql.startswith('SELECT') or sql.startswith('WITH')):
+            return
+        if any(re.search(rf'\b{table}\b', statement) for table in WATCHED_TABLES):
+            captured.append((current['label'], statement, parameters))
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'plan_checker', 'password': 'plan_checker'})
+    for label, method, path, body in ENDPOINTS:
+        current['label'] = label + suffix
+        response = client.open(path, method=method, json=body)
+        if response.status_code >= 500:
+            print(f"[警告] {label} {path} 返回 {response.status_code}")
+
+    event.remove(engine, 'before_cursor_execute', record)
+    return captured
+
+
+def main(verbose=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'plans.db')}",
+                          'TESTING': True})
+        seed(app)
+        queries = capture_queries(app)
+        with app.app_context():
+            with db.engine.begin() as conn:
+                partition_manager.seal(conn)
+                bump_data_version(conn)  # 封存不改变数据，这里只是让各接口绕过结果缓存重新查询
+                conn.exec_driver_sql("ANALYZE")
+        queries += capture_queries(app, '(分区)')
+
+        failures = 0
+        with app.app_context():
+            raw = db.engine.raw_connection()
+            try:
+                for label, statement, parameters in queries:
+                    plan = [row[-1] for row in raw.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                    scans = [step for step in plan
+                             if (m := FULL_SCAN.match(step))
+                             and (m.group(1) in WATCHED_TABLES or PARTITION_NAME.match(m.group(1)))]
+                    status = '全表扫描' if scans else 'OK'
+                    failures += bool(scans)
+                    if scans or verbose:
+                        print(f"[{status}] {label}: {' '.join(statement.split())[:160]}")
+                        for step in plan:
+                            print(f"        {step}")
+            finally:
+                raw.close()
+            db.engine.dispose()
+
+    print(f"共检查 {len(queries)} 条查询，{failures} 条退化为全表扫描")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main('-v' in sys.argv[1:]))
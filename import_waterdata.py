@@ -1,10 +1,19 @@
 import os
+import argparse
 import pandas as pd
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from app.services.structured_schema import (
+    STRUCTURED_SCHEMA, PROVINCE_COLUMN, BASIN_COLUMN, TIME_FORMAT, quote_identifier
+)
+from app.services.facets import refresh_facets
 
 ROOT_DIR = r'C:\Users\11615\Downloads\data\水质数据\water_quality_by_name'
 DB_PATH = 'water_quality_structured.db'
 SUPPORTED_EXTS = ['.xlsx', '.xls', '.csv']
+# 并行导入时每个文件用于推断未声明列类型的样本行数
+SAMPLE_ROWS = 2000
 
 # 省份和流域白名单
 province_whitelist = [
@@ -23,21 +32,22 @@ def get_all_data_files(root_dir):
                 data_files.append(os.path.join(dirpath, fname))
     return data_files
 
-def read_data_file(filepath):
+def read_data_file(filepath, nrows=None):
+    """读取数据文件，nrows 不为空时只读取前 nrows 行"""
     ext = os.path.splitext(filepath)[-1].lower()
     try:
         if ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(filepath)
+            df = pd.read_excel(filepath, nrows=nrows)
         elif ext == '.csv':
             # 自动尝试多种编码和分隔符
             for enc in ['utf-8', 'gbk', 'gb2312']:
                 try:
-                    df = pd.read_csv(filepath, encoding=enc)
+                    df = pd.read_csv(filepath, encoding=enc, nrows=nrows)
                     if df.shape[1] < 2:
                         # 可能是分隔符问题
-                        df = pd.read_csv(filepath, encoding=enc, delimiter=';')
+                        df = pd.read_csv(filepath, encoding=enc, delimiter=';', nrows=nrows)
                     if df.shape[1] < 2:
-                        df = pd.read_csv(filepath, encoding=enc, delimiter='\t')
+                        df = pd.read_csv(filepath, encoding=enc, delimiter='\t', nrows=nrows)
                     break
                 except Exception:
                     continue
@@ -50,6 +60,159 @@ def read_data_file(filepath):
         print(f"读取文件失败: {filepath}, 错误: {e}")
         return None
 
+def infer_sql_type(series):
+    """推断未声明列的类型：全部非空值都能转为数值则为 REAL，否则为 TEXT；没有非空值时返回 None"""
+    values = series.dropna()
+    if values.empty:
+        return None
+    return 'REAL' if pd.to_numeric(values, errors='coerce').notna().all() else 'TEXT'
+
+def merge_sql_types(samples):
+    """合并各文件样本推断出的类型：任一文件为 TEXT 即为 TEXT，所有样本都没有值的列也为 TEXT"""
+    types = {}
+    for sample in samples:
+        for col, sql_type in sample.items():
+            if types.get(col) != 'TEXT':
+                types[col] = sql_type or types.get(col)
+    return {col: sql_type or 'TEXT' for col, sql_type in types.items()}
+
+def format_text_value(value):
+    """TEXT 列的取值转为字符串；整数值的浮点数（读入时因空值被转成 float）不带 .0 后缀"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def load_valid_rows(filepath, nrows=None):
+    """读取文件并只保留省份和流域在白名单内的行
+
+    返回 (DataFrame 或 None, 跳过的异常行数, 提示信息)
+    """
+    df = read_data_file(filepath, nrows)
+    if df is None or df.empty:
+        return None, 0, '跳过空文件'
+
+    df.columns = [str(col).strip() for col in df.columns]
+    df = df.loc[:, ~df.columns.duplicated()]
+    if not (PROVINCE_COLUMN in df.columns and BASIN_COLUMN in df.columns):
+        return None, 0, '跳过无省份/流域字段的文件'
+
+    valid_rows = df[
+        df[PROVINCE_COLUMN].isin(province_whitelist) &
+        df[BASIN_COLUMN].isin(basin_whitelist)
+    ]
+    return valid_rows, len(df) - len(valid_rows), None
+
+def sample_column_types(filepath, nrows=SAMPLE_ROWS):
+    """在工作进程中读取文件的前 nrows 行，推断未声明列的类型：{列名: 'REAL'/'TEXT'/None}"""
+    valid_rows, _, message = load_valid_rows(filepath, nrows)
+    if message:
+        return {}
+    return {col: infer_sql_type(valid_rows[col]) for col in valid_rows.columns if col not in STRUCTURED_SCHEMA}
+
+def parse_typed_file(filepath, types):
+    """在工作进程中读取、过滤并按 types（全部文件统一的 {列名: 类型}）转换单个文件
+
+    返回 (文件路径, DataFrame 或 None, 跳过的异常行数, 提示信息)
+    """
+    valid_rows, skipped, message = load_valid_rows(filepath)
+    if message:
+        return filepath, None, 0, message
+    if valid_rows.empty:
+        return filepath, None, skipped, '没有有效数据行'
+
+    valid_rows = valid_rows.copy()
+    for col in valid_rows.columns:
+        sql_type = types.get(col, 'TEXT')
+        if sql_type == 'REAL':
+            # '--'、'*' 等占位符转为空值
+            valid_rows[col] = pd.to_numeric(valid_rows[col], errors='coerce')
+        elif sql_type == 'DATETIME':
+            parsed = pd.to_datetime(valid_rows[col], errors='coerce', format='mixed')
+            # 无法解析的时间保留原文，避免丢失数据
+            valid_rows[col] = parsed.dt.strftime(TIME_FORMAT).where(parsed.notna(), valid_rows[col])
+        else:
+            valid_rows[col] = valid_rows[col].map(format_text_value, na_action='ignore')
+
+    valid_rows = valid_rows.astype(object)
+    valid_rows = valid_rows.where(valid_rows.notna(), None)
+    return filepath, valid_rows, skipped, None
+
+class TypedWriter:
+    """单一写入者：按全部文件统一的列类型一次建表，批量写入各工作进程的解析结果"""
+
+    def __init__(self, db_path, columns, batch_size=20000):
+        self.conn = sqlite3.connect(db_path)
+        self.batch_size = batch_size
+        self.pending = 0
+
+        cursor = self.conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("DROP TABLE IF EXISTS water_quality")
+        column_defs = ', '.join(f"{quote_identifier(col)} {sql_type}" for col, sql_type in columns.items())
+        cursor.execute(f"CREATE TABLE water_quality (id INTEGER PRIMARY KEY AUTOINCREMENT, {column_defs})")
+        self.conn.commit()
+
+    def write(self, df):
+        cols = ','.join(quote_identifier(c) for c in df.columns)
+        placeholders = ','.join(['?'] * len(df.columns))
+        sql = f"INSERT INTO water_quality ({cols}) VALUES ({placeholders})"
+        self.conn.executemany(sql, df.itertuples(index=False, name=None))
+        self.pending += len(df)
+        if self.pending >= self.batch_size:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        self.conn.commit()
+        refresh_facets(self.conn)
+        self.conn.close()
+
+def main_parallel(workers=None, batch_size=20000):
+    """并行导入模式：进程池解析文件，单个写入者批量写入带类型的表
+
+    先并行读取每个文件的前 SAMPLE_ROWS 行，合并推断出全部未声明列的类型后一次建表，
+    之后所有文件按同一套类型转换，后读到的文件不会把文本写进已推断为 REAL 的列。
+    """
+    files = get_all_data_files(ROOT_DIR)
+    print(f"共找到 {len(files)} 个数据文件，使用 {workers or os.cpu_count()} 个进程解析")
+    total_inserted = 0
+    skipped_files = 0
+    skipped_rows = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        inferred = merge_sql_types(executor.map(sample_column_types, files))
+        types = {**STRUCTURED_SCHEMA, **inferred}
+        writer = TypedWriter(DB_PATH, types, batch_size=batch_size)
+
+        # 限制在途任务数量，避免解析结果在内存中堆积
+        max_in_flight = (workers or os.cpu_count() or 1) * 4
+        remaining = iter(files)
+        in_flight = set()
+        while True:
+            for f in remaining:
+                in_flight.add(executor.submit(parse_typed_file, f, types))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                f, df, skipped, message = future.result()
+                if skipped > 0:
+                    print(f"文件 {f} 跳过异常行: {skipped}")
+                    skipped_rows += skipped
+                if df is None:
+                    print(f"{message}: {f}")
+                    if message != '没有有效数据行':
+                        skipped_files += 1
+                    continue
+                writer.write(df)
+                total_inserted += len(df)
+
+    writer.close()
+    print(f"导入完成！共插入 {total_inserted} 行，跳过文件 {skipped_files} 个，跳过异常行 {skipped_rows} 行。")
+
 def main():
     # 创建数据库
     conn = sqlite3.connect(DB_PATH)
@@ -117,11 +280,27 @@ def main():
 
         conn.commit()
 
+    # 重建省份/流域/断面筛选项字典
+    refresh_facets(conn)
     print(f"导入完成！共插入 {total_inserted} 行，跳过文件 {skipped_files} 个，跳过异常行 {skipped_rows} 行。")
     conn.close()
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='导入水质数据文件到结构化数据库')
+    parser.add_argument('--parallel', action='store_true', help='使用多进程解析和带类型的表结构')
+    parser.add_argument('--workers', type=int, default=None, help='解析进程数，默认为CPU核数')
+    parser.add_argument('--batch-size', type=int, default=20000, help='每次提交的行数')
+    parser.add_argument('--refresh-facets', action='store_true', help='只为已有数据库重建筛选项字典')
+    args = parser.parse_args()
+
+    if args.refresh_facets:
+        conn = sqlite3.connect(DB_PATH)
+        print(f"筛选项字典已重建，共 {refresh_facets(conn)} 个断面分组。")
+        conn.close()
+    elif args.parallel:
+        main_parallel(args.workers, args.batch_size)
+    else:
+        main()
     import sqlite3
     conn = sqlite3.connect('water_quality_structured.db')
     cursor = conn.cursor()
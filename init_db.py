@@ -1,12 +1,20 @@
 import os
 import json
 import re
+import html
 from datetime import datetime
-from bs4 import BeautifulSoup
 
 from app import create_app, db
 # 确保所有需要用到的模型都被导入
 from app.models import User, RanchLocation, WaterQuality
+from app.services.ingestion import WaterQualityIngestor
+from app.migrations import upgrade_database
+
+# 每批写入并提交的记录数，内存占用只与批大小有关
+BATCH_SIZE = 5000
+
+NUMBER_IN_TAG = re.compile(r'>([\d.-]+)<')
+HTML_TAG = re.compile(r'<[^>]*>')
 
 # --- 数据清洗辅助函数 ---
 def clean_html_and_get_float(html_string):
@@ -15,7 +23,7 @@ def clean_html_and_get_float(html_string):
         return None
     try:
         # 优先使用正则表达式从HTML标签中提取内容，效率更高
-        match = re.search(r'>([\d.-]+)<', html_string)
+        match = NUMBER_IN_TAG.search(html_string)
         if match:
             return float(match.group(1))
         # 如果正则匹配失败（例如字符串本身就是数字），则直接尝试转换
@@ -34,12 +42,85 @@ def parse_monitoring_time(time_str, year_str):
         # 如果格式不匹配，返回None，避免程序中断
         return None
 
+def clean_html_text(html_string):
+    """去除HTML标签并反转义实体，得到纯文本（不构建解析树）
+
+    与 BeautifulSoup 的 get_text(strip=True) 一致：每个文本节点各自去掉首尾空白后直接拼接。
+    """
+    if not html_string:
+        return None
+    if '<' not in html_string and '&' not in html_string:
+        return html_string.strip() or None
+    return ''.join(html.unescape(piece).strip() for piece in HTML_TAG.split(html_string)) or None
+
+def iter_month_files(base_dir):
+    """按月份目录顺序逐个产出 (年份, 文件路径)"""
+    for month_folder in sorted(os.listdir(base_dir)):
+        month_path = os.path.join(base_dir, month_folder)
+        if not os.path.isdir(month_path) or not month_folder.startswith('202'):
+            continue
+
+        year_str = month_folder[:4]
+        for fname in sorted(os.listdir(month_path)):
+            if fname.endswith('.json'):
+                yield year_str, os.path.join(month_path, fname)
+
+def iter_file_records(fpath, year_str):
+    """逐行解析单个月度 JSON 文件中的 tbody，产出可直接写入的记录字典"""
+    with open(fpath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for row in data.get('tbody', []):
+        if not row or len(row) < 17: continue
+        monitor_time_obj = parse_monitoring_time(row[3], year_str)
+        if not monitor_time_obj: continue
+
+        yield dict(
+            province=row[0], basin=row[1],
+            section_name=clean_html_text(row[2]),
+            monitor_time=monitor_time_obj, quality_level=row[4] if row[4] else None,
+            temperature=clean_html_and_get_float(row[5]), pH=clean_html_and_get_float(row[6]),
+            dissolved_oxygen=clean_html_and_get_float(row[7]), conductivity=clean_html_and_get_float(row[8]),
+            turbidity=clean_html_and_get_float(row[9]), permanganate_index=clean_html_and_get_float(row[10]),
+            ammonia_nitrogen=clean_html_and_get_float(row[11]), total_phosphorus=clean_html_and_get_float(row[12]),
+            total_nitrogen=clean_html_and_get_float(row[13]), chlorophyll_a=clean_html_and_get_float(row[14]),
+            algae_density=clean_html_and_get_float(row[15]), station_status=row[16] if row[16] else None
+        )
+
+def stream_import_water_quality(base_dir, batch_size=BATCH_SIZE):
+    """流式导入：逐个文件解析，攒满固定大小的批次即写入并提交"""
+    total = 0
+    batch = []
+
+    def flush():
+        nonlocal total
+        # 写入失败时事务已回滚，这一批同样清空，避免失败的记录混入下一批重复写入
+        try:
+            with db.engine.begin() as conn:
+                total += WaterQualityIngestor.insert_records(conn, batch)
+        finally:
+            batch.clear()
+
+    for year_str, fpath in iter_month_files(base_dir):
+        print(f"  - 正在处理: {fpath}")
+        try:
+            for record in iter_file_records(fpath, year_str):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    flush()
+        except Exception as e:
+            print(f"    ! 处理文件 {os.path.basename(fpath)} 时发生错误: {e}")
+    if batch:
+        flush()
+    return total
+
 # --- 主程序 ---
 app = create_app()
 
 with app.app_context():
     print("初始化数据库表...")
     db.create_all()
+    # 补建索引；已有水质数据而派生数据尚未回填时在这里重建
+    upgrade_database(db.engine)
 
     # 2. 初始化用户和位置数据
     if not User.query.filter_by(username='admin').first():
@@ -75,48 +156,9 @@ with app.app_context():
         if not os.path.exists(base_dir):
             print(f"水质数据目录不存在: {base_dir}，无法导入。")
         else:
-            all_records_to_add = []
-            for month_folder in os.listdir(base_dir):
-                month_path = os.path.join(base_dir, month_folder)
-                if not os.path.isdir(month_path) or not month_folder.startswith('202'):
-                    continue
-                
-                year_str = month_folder[:4]
-                for fname in os.listdir(month_path):
-                    if not fname.endswith('.json'):
-                        continue
-                    
-                    fpath = os.path.join(month_path, fname)
-                    print(f"  - 正在处理: {fpath}")
-                    with open(fpath, 'r', encoding='utf-8') as f:
-                        try:
-                            data = json.load(f)
-                            tbody = data.get('tbody', [])
-                            for row in tbody:
-                                if not row or len(row) < 17: continue
-                                monitor_time_obj = parse_monitoring_time(row[3], year_str)
-                                if not monitor_time_obj: continue
-
-                                record = WaterQuality(
-                                    province=row[0], basin=row[1],
-                                    section_name=BeautifulSoup(row[2], 'html.parser').get_text(strip=True) if row[2] else None,
-                                    monitor_time=monitor_time_obj, quality_level=row[4] if row[4] else None,
-                                    temperature=clean_html_and_get_float(row[5]), pH=clean_html_and_get_float(row[6]),
-                                    dissolved_oxygen=clean_html_and_get_float(row[7]), conductivity=clean_html_and_get_float(row[8]),
-                                    turbidity=clean_html_and_get_float(row[9]), permanganate_index=clean_html_and_get_float(row[10]),
-                                    ammonia_nitrogen=clean_html_and_get_float(row[11]), total_phosphorus=clean_html_and_get_float(row[12]),
-                                    total_nitrogen=clean_html_and_get_float(row[13]), chlorophyll_a=clean_html_and_get_float(row[14]),
-                                    algae_density=clean_html_and_get_float(row[15]), station_status=row[16] if row[16] else None
-                                )
-                                all_records_to_add.append(record)
-                        except Exception as e:
-                            print(f"    ! 处理文件 {fname} 时发生错误: {e}")
-            
-            if all_records_to_add:
-                print(f"准备将 {len(all_records_to_add)} 条数据存入数据库...")
-                db.session.bulk_save_objects(all_records_to_add)
-                db.session.commit()
-                print("水质数据导入成功！")
+            total = stream_import_water_quality(base_dir)
+            if total:
+                print(f"水质数据导入成功！共写入 {total} 条数据。")
             else:
                 print("没有找到可导入的水质数据。")
     else:
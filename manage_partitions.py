@@ -0,0 +1,68 @@
+"""水质读数分区维护：封存已结束的月份、更新 Parquet 归档、删除过期分区
+
+建议每月初（或每天）定时运行一次：
+    python manage_partitions.py                     # 封存本月之前的读数，并按 WATER_QUALITY_RETENTION_MONTHS 清理
+    python manage_partitions.py --drop-before 2023-01   # 删除 2023 年 1 月之前的全部原始读数
+    python manage_partitions.py --list              # 查看各分区行数
+"""
+import argparse
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app import create_app, db
+from app.migrations import upgrade_database
+from app.services.partitions import partition_manager, list_partitions
+from app.services.archive import parquet_archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description='水质读数按月分区维护')
+    parser.add_argument('--before', help='封存该月份（YYYY-MM）之前的读数，默认本月')
+    parser.add_argument('--drop-before', help='删除该月份（YYYY-MM）之前的全部原始读数')
+    parser.add_argument('--retention-months', type=int, default=None, help='覆盖配置中的保留月数')
+    parser.add_argument('--list', action='store_true', help='只列出已有分区')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upgrade_database(db.engine)
+
+        if not args.list:
+            with db.engine.begin() as conn:
+                before = datetime.strptime(args.before, '%Y-%m') if args.before else None
+                for name, count in partition_manager.seal(conn, before).items():
+                    print(f"  - 封存 {count} 条读数到 {name}")
+
+            # 归档必须紧跟封存，且只读取已提交的分区：补录读数并入已归档的月份后，对应文件需要重写
+            with db.engine.connect() as conn:
+                for month, count in parquet_archive.refresh(conn).items():
+                    print(f"  - 归档 {count} 条读数到 {parquet_archive.path(month)}")
+
+            if args.drop_before:
+                cutoff = datetime.strptime(args.drop_before, '%Y-%m')
+            else:
+                if args.retention_months is not None:
+                    partition_manager.retention_months = args.retention_months
+                cutoff = partition_manager.retention_cutoff()
+            if cutoff is not None:
+                with db.engine.begin() as conn:
+                    for name in partition_manager.drop_before(conn, cutoff):
+                        print(f"  - 已删除分区 {name}")
+                # 分区和派生数据提交后再删除同月的归档文件，统计不再混入已删除月份的读数
+                for month in parquet_archive.drop_before(cutoff):
+                    print(f"  - 已删除归档 {parquet_archive.path(month)}")
+
+        with db.engine.connect() as conn:
+            for month, table in list_partitions(conn):
+                count = conn.execute(select(func.count()).select_from(table)).scalar()
+                print(f"{month:%Y-%m}  {table.name}  {count} 条")
+            hot = conn.execute(select(func.count()).select_from(db.metadata.tables['water_quality'])).scalar()
+            print(f"热表 water_quality  {hot} 条")
+            if not parquet_archive.available:
+                print("未安装 pyarrow，Parquet 归档未启用")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import os
+import sqlite3
+
+from app import create_app, db
+from app.services.ingestion import WaterQualityIngestor
+from app.services.structured_db import DEFAULT_DB_PATH
+from app.services.structured_schema import TYPED_COLUMN_MAP, quote_identifier
+from app.migrations import upgrade_database
+
+# 每批读取并提交的行数，内存占用只与批大小有关
+CHUNK_SIZE = 20000
+
+
+def iter_source_chunks(conn, chunk_size, after_id=0):
+    """按 id 顺序分批读取结构化库，列名换成 WaterQuality 的字段名，产出 (本批最大 id, DataFrame)"""
+    import pandas as pd
+
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(water_quality)")}
+    columns = [col for col in TYPED_COLUMN_MAP if col in existing]
+    select_list = ', '.join(['id'] + [quote_identifier(col) for col in columns])
+    sql = f"SELECT {select_list} FROM water_quality WHERE id > ? ORDER BY id LIMIT ?"
+
+    last_id = after_id
+    while True:
+        df = pd.read_sql_query(sql, conn, params=(last_id, chunk_size))
+        if df.empty:
+            return
+        last_id = int(df['id'].iloc[-1])
+        yield last_id, df.drop(columns='id').rename(columns=TYPED_COLUMN_MAP)
+
+
+def migrate(source, chunk_size=CHUNK_SIZE, after_id=0):
+    """把结构化库中 id 大于 after_id 的行迁移到主库 WaterQuality 表，每批一个事务
+
+    写入走 WaterQualityIngestor，汇总表、统计量、断面最新状态和筛选项字典在同一事务中同步维护；
+    中途失败时已提交的批次保留，按输出的最后 id 用 --after-id 续传即可。
+    """
+    ingestor = WaterQualityIngestor(chunk_size=chunk_size)
+    total = errors = 0
+    conn = sqlite3.connect(source)
+    try:
+        for last_id, df in iter_source_chunks(conn, chunk_size, after_id):
+            with db.engine.begin() as target:
+                result = ingestor.ingest(df, target)
+            total += result.success_count
+            errors += result.error_count
+            print(f"  - 已迁移至 id {last_id}：本批写入 {result.success_count} 条，跳过 {result.error_count} 条")
+    finally:
+        conn.close()
+    return total, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将结构化水质数据库迁移到主库的 WaterQuality 表')
+    parser.add_argument('--source', default=DEFAULT_DB_PATH, help='结构化数据库路径')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='每批读取并提交的行数')
+    parser.add_argument('--after-id', type=int, default=0, help='从结构化库中该 id 之后继续迁移（用于续传）')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"结构化数据库不存在: {args.source}")
+        return
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upgrade_database(db.engine)
+        total, errors = migrate(args.source, args.chunk_size, args.after_id)
+    print(f"迁移完成！共写入 {total} 条数据，跳过 {errors} 条无效数据。")
+    print("设置 WATER_DATA_BACKEND = 'typed' 后原始数据接口将改为读取主库。")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 from app import create_app, db
+from app.migrations import upgrade_database
 
 app = create_app()
 
 with app.app_context():
     db.create_all()
+    upgrade_database(db.engine)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)